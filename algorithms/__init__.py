@@ -1,27 +1,100 @@
 from .utils import UNSAT
-from .forward import construct_greedy
-from .backward import relax_sequence, filter_sequence
+from .forward import construct_greedy, iter_construct_greedy
+from .backward import relax_sequence, filter_sequence, iter_relax_sequence, iter_filter_sequence
 from .propagate import ExactPropagate
+from .cache import PropagationCache
+from .scheduling import CandidateScheduler, SuccessPriorScheduler
+from .checkpoint import Checkpoint
+from .stats import Stats
 
-def find_sequence(constraints, goal_literals=UNSAT, propagator=ExactPropagate, seed=0,time_limit=3600):
+def find_sequence(constraints, goal_literals=UNSAT, propagator=ExactPropagate, seed=0,time_limit=3600, n_workers=1, cache_size=None, cache_path=None,
+                  scheduler=None, checkpoint_path=None, checkpoint_interval=60, checkpoint_cache=False, resume_from=None,
+                  deletion="linear", relax_mode="mus", checker_solver=None, stats=None):
     """
         Find a sequence of constraints that explains the goal literals.
         :param constraints: a list of CPMpy constraints
         :param goal_literals: a set of literals that the sequence should explain, defaults to {False}
         :param PROP: the propagator to use, defaults to ExactPropagate
         :param time_limit: the time limit for the search
+        :param n_workers: number of worker processes used to propagate candidate steps during greedy construction
+        :param cache_size: maximum number of entries in the propagation cache of each stage, defaults to unbounded
+        :param cache_path: optional path to an on-disk propagation cache, shared across runs and processes
+        :param scheduler: optional CandidateScheduler class ordering candidate steps during greedy construction
+        :param checkpoint_path: optional path to which the progress of each stage is written every `checkpoint_interval` seconds
+        :param checkpoint_cache: also write the entries of the propagation cache to the checkpoint
+        :param resume_from: optional path to a checkpoint to resume from, new checkpoints are written to the same path
+            if no checkpoint_path is given
+        :param deletion: strategy to leave out redundant steps when filtering the sequence, "linear" or "quickxplain"
+        :param relax_mode: how the input of each step is minimized when relaxing the sequence, "mus" or "ocus"
+        :param checker_solver: solver checking for conflicts while filtering, defaults to the solver of the propagator
+        :param stats: optional Stats collecting counters, timers and histograms of the propagators and stages
     """
+    messages = dict(greedy="Found initial sequence of length", filter="Filtered sequence of length", relax="Relaxed sequence of length")
+    for event in iter_find_sequence(constraints, goal_literals, propagator=propagator, seed=seed, time_limit=time_limit,
+                                    n_workers=n_workers, cache_size=cache_size, cache_path=cache_path, scheduler=scheduler,
+                                    checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval,
+                                    checkpoint_cache=checkpoint_cache, resume_from=resume_from, deletion=deletion,
+                                    relax_mode=relax_mode, checker_solver=checker_solver, stats=stats):
+        if event['event'] == "resume":
+            print(f"Resuming from {event['stage']} stage with sequence of length", len(event['seq']))
+        elif event['event'] == "stage":
+            print(messages[event['stage']], len(event['seq']))
+        if 'seq' in event:
+            seq = event['seq']
+    return seq
+
+
+def iter_find_sequence(constraints, goal_literals=UNSAT, propagator=ExactPropagate, seed=0,time_limit=3600, n_workers=1, cache_size=None,
+                       cache_path=None, scheduler=None, checkpoint_path=None, checkpoint_interval=60, checkpoint_cache=False,
+                       resume_from=None, deletion="linear", relax_mode="mus", checker_solver=None, stats=None):
+    """
+        Same as `find_sequence`, but a generator yielding events as soon as they happen, so partial explanations can be shown
+            and the search can be stopped early by closing the generator. Events are dicts with keys "event" and "stage":
+        - dict(event="resume", stage=stage, seq=seq) when resuming from a checkpoint
+        - dict(event="step", stage="greedy", step=step) for every step added during greedy construction
+        - dict(event="removed", stage="filter", step=step) for every step left out during filtering
+        - dict(event="relaxed", stage="relax", step=step, index=i) for every step whose input is minimized, from back to front,
+            and dict(event="removed", stage="relax", step=step) for steps that turn out not to be needed
+        - dict(event="stage", stage=stage, seq=seq) when a stage is done, the last one holds the final sequence
+        Time spent by the caller between events counts towards the time limits of the stages.
+    """
+
+    checkpoint, stage = None, "greedy"
+    if checkpoint_path is not None or resume_from is not None:
+        checkpoint = Checkpoint(checkpoint_path if checkpoint_path is not None else resume_from, constraints,
+                                interval=checkpoint_interval, include_cache=checkpoint_cache)
+        if resume_from is not None:
+            stage = checkpoint.load(resume_from)
+            seq = checkpoint.sequence()
+            yield dict(event="resume", stage=stage, seq=seq)
 
     # construct initial sequence
-    seq = construct_greedy(constraints, goal_literals, time_limit, seed, PROP=propagator)
-    print("Found initial sequence of length", len(seq))
+    if stage == "greedy":
+        seq = yield from iter_construct_greedy(constraints, goal_literals, time_limit, seed, PROP=propagator, n_workers=n_workers,
+                                               caching=PropagationCache(max_entries=cache_size), persistent_cache=cache_path,
+                                               scheduler=scheduler, checkpoint=checkpoint, stats=stats)
+        yield dict(event="stage", stage="greedy", seq=seq)
+        stage = _next_stage(checkpoint, "filter", seq)
 
     # filter sequence
-    seq = filter_sequence(seq, time_limit=time_limit, propagator_class=propagator)
-    print("Filtered sequence of length", len(seq))
+    if stage == "filter":
+        seq = yield from iter_filter_sequence(seq, goal_literals, time_limit=time_limit, propagator_class=propagator,
+                                              caching=PropagationCache(max_entries=cache_size), persistent_cache=cache_path,
+                                              checkpoint=checkpoint, deletion=deletion, checker_solver=checker_solver,
+                                              stats=stats)
+        yield dict(event="stage", stage="filter", seq=seq)
+        stage = _next_stage(checkpoint, "relax", seq)
 
     # relax sequence
-    seq = relax_sequence(seq, time_limit=time_limit)
-    print("Relaxed sequence of length", len(seq))
+    if stage == "relax":
+        seq = yield from iter_relax_sequence(seq, time_limit=time_limit, persistent_cache=cache_path, checkpoint=checkpoint,
+                                             mode=relax_mode, stats=stats)
+        yield dict(event="stage", stage="relax", seq=seq)
+        stage = _next_stage(checkpoint, "done", seq)
+
 
-    return seq
\ No newline at end of file
+def _next_stage(checkpoint, stage, seq):
+    # the next stage starts from the full output of the previous one
+    if checkpoint is not None:
+        checkpoint.save(stage, seq, force=True)
+    return stage
@@ -2,199 +2,509 @@ import copy
 from time import time
 
 import cpmpy as cp
-from cpmpy.tools.explain import mus, smus
+import numpy as np
 from cpmpy.expressions.core import Expression
+from cpmpy.tools.explain.utils import make_assump_model
 
-from .propagate import ExactPropagate, CPPropagate, filter_lits_to_vars
-from .utils import EPSILON, get_variables
+from .propagate import ExactPropagate, CPPropagate
+from .utils import EPSILON, get_variables, exhaust
+from .datastructures import SetTrie, SuffixTrie, UNSAT_BIT, iter_bits
+from .subset import OCUSEngine
+from .stats import timed
 
 
-def filter_sequence(seq, goal_literals, time_limit, propagator_class=ExactPropagate):
+class ConflictChecker:
+    """
+        Incremental check whether a set of constraints is inconsistent with a set of literals.
+        One solver holds all constraints behind indicator variables and every literal behind a guard variable,
+            so a check is a single solve under assumptions.
+        Cores of inconsistent checks and maximal consistent checks are stored in set-tries,
+            checks implied by earlier ones are answered without calling the solver.
+        Constraints are given as bitset of their indices, literals as bitset of the encoding.
+        Guards are posted when a literal is first checked, all new guards of a check at once,
+            as every call to add constraints to the solver has a fixed cost.
+    """
+
+    def __init__(self, constraints, encoding, solver="exact"):
+        self.constraints = list(constraints)
+        self.encoding = encoding
+        self.n_cons = len(self.constraints)
+        self.n_lits = len(encoding.lits) # bits of literals in the combined bitset
+
+        model, soft, assump = make_assump_model(soft=self.constraints)
+        self.indicators = list(assump)
+        self.solver = cp.SolverLookup.get(solver)
+        self.solver += model.constraints
+        # assumption variable -> its bit in the combined bitset of constraints and literals, and the inverse
+        self.assump_bits = {var: 1 << i for i, var in enumerate(self.indicators)}
+        self.assump_vars = dict(enumerate(self.indicators))
+        self.guarded = 0 # bitset of the literals with a guard
+
+        self.cores = SetTrie() # inconsistent sets of constraints and literals, kept minimal
+        self.sat = SetTrie() # consistent sets of constraints and literals, kept maximal
+
+    def key(self, cons_bits, literals):
+        """
+            Combined bitset of constraints and literals
+        """
+        return cons_bits | (literals << self.n_cons)
+
+    def has_conflict(self, cons_bits, literals):
+        """
+            Returns True if the constraints in `cons_bits` are inconsistent with the literals
+        """
+        if literals & UNSAT_BIT:
+            return True
+        key = self.key(cons_bits, literals)
+        if self.cores.has_subset(key):
+            return True
+        return self.core(key) is not None
+
+    def _guard(self, literals):
+        # post the guards of the literals that do not have one yet
+        new = literals & ~self.guarded
+        if new == 0:
+            return
+        guards = []
+        for bit in iter_bits(new):
+            guard = cp.boolvar(name=f"guard[{bit}]")
+            self.assump_bits[guard] = 1 << (bit + self.n_cons)
+            self.assump_vars[bit + self.n_cons] = guard
+            guards.append(guard.implies(self.encoding.lits[bit]))
+        self.solver += guards
+        self.guarded |= new
+
+    def core(self, key):
+        """
+            Returns a subset of the combined bitset that is inconsistent, or None if it is consistent
+        """
+        cores = self.cores.subsets(key)
+        if len(cores):
+            return cores[0]
+        if self.sat.has_superset(key):
+            return None
+
+        self._guard((key >> self.n_cons) & ((1 << self.n_lits) - 1))
+        if self.solver.solve(assumptions=[self.assump_vars[i] for i in iter_bits(key)]) is True:
+            self.sat.add_maximal(key)
+            return None
+
+        core = 0
+        for var in self.solver.get_core():
+            core |= self.assump_bits[var]
+        self.cores.add_minimal(core)
+        return core
+
+
+class MUSEngine(ConflictChecker):
+    """
+        Incremental MUS extraction for the steps of a sequence.
+        Extends the conflict checker with an activation variable per set of output literals, enforcing that one of them is false.
+        A step derives its output from a set of literals if its constraints, the literals and the activation variable are inconsistent.
+        The solver is built once for all steps, a call only changes which constraints and literals are assumed hard or soft.
+    """
+
+    def __init__(self, constraints, encoding, solver="exact"):
+        super().__init__(constraints, encoding, solver=solver)
+        self.activators = dict() # bitset of output literals -> bit of its activation variable in the combined bitset
+
+    def _activator(self, output):
+        bit = self.activators.get(output)
+        if bit is None:
+            var = cp.boolvar(name=f"derive[{len(self.activators)}]")
+            self.solver += var.implies(cp.any([~self.encoding.lits[lit] for lit in iter_bits(output)]))
+            bit = self.n_cons + self.n_lits + len(self.activators)
+            self.activators[output] = bit
+            self.assump_bits[var] = 1 << bit
+            self.assump_vars[bit] = var
+        return 1 << bit
+
+    def mus(self, soft, hard, cons_bits, output):
+        """
+            Returns a subset-minimal bitset of the soft literals,
+                which derives the output literals together with the hard literals and the constraints in `cons_bits`
+        """
+        hard_key = cons_bits | (hard << self.n_cons) | self._activator(output)
+        core = self.core(hard_key | (soft << self.n_cons))
+        assert core is not None, "The soft and hard literals do not derive the output"
+
+        required = (core >> self.n_cons) & soft
+        for lit in list(iter_bits(required)):
+            if required & (1 << lit) == 0:
+                continue # already removed by a smaller core
+            core = self.core(hard_key | ((required & ~(1 << lit)) << self.n_cons))
+            if core is not None:
+                required = (core >> self.n_cons) & soft
+        return required
+
+
+def filter_sequence(seq, goal_literals, time_limit, propagator_class=ExactPropagate, caching=True, persistent_cache=None, checkpoint=None,
+                    deletion="linear", checker_solver=None, cp_propagator_class=None, stats=None):
     """
     Filter sequence from redundant steps.
         loops over sequence from back to front and attempts to leave out a step
         if the remaining sequence is still valid, it is removed, otherwise the step is kept in the sequence
+    :param caching: caching policy of the propagator, True, False or a PropagationCache with bounded size
+    :param persistent_cache: optional path to (or PersistentCache of) an on-disk cache shared across runs
+    :param checkpoint: optional Checkpoint, the partially filtered sequence and deletion index are written to it periodically,
+        and filtering resumes from it if it holds a loaded "filter" checkpoint
+    :param deletion: "linear" tries to leave out the steps one by one,
+        "quickxplain" tries to leave out blocks of steps at once and only splits a block if it cannot be left out,
+        which needs fewer checks when most steps are redundant
+    :param checker_solver: name of the solver checking whether the remaining constraints still conflict,
+        defaults to the solver of the propagator. False, or a propagator without a solver, skips the check,
+        every attempt is then decided by propagating the remaining steps
+    :param cp_propagator_class: propagator trying to reach the goal with the remaining steps before they are propagated
+        with `propagator_class`, defaults to CPPropagate if the propagator has a solver. False skips this pre-check
+    :param stats: optional Stats, receives the time of the stage, the deletion attempts and the propagation calls
+    """
+    return exhaust(iter_filter_sequence(seq, goal_literals, time_limit, propagator_class=propagator_class, caching=caching,
+                                        persistent_cache=persistent_cache, checkpoint=checkpoint, deletion=deletion,
+                                        checker_solver=checker_solver, cp_propagator_class=cp_propagator_class, stats=stats))
+
+
+def iter_filter_sequence(seq, goal_literals, time_limit, propagator_class=ExactPropagate, caching=True, persistent_cache=None,
+                         checkpoint=None, deletion="linear", checker_solver=None, cp_propagator_class=None, stats=None):
     """
+        Same as `filter_sequence`, but a generator yielding `dict(event="removed", stage="filter", step=step)`
+            for every step as soon as it is left out of the sequence.
+        Returns the filtered sequence when exhausted, closing the generator stops filtering.
+    """
+    assert deletion in ("linear", "quickxplain"), f"Unknown deletion strategy {deletion}"
+    with timed(stats, "filter"):
+        return (yield from _filter_sequence(seq, goal_literals, time_limit, propagator_class, caching, persistent_cache, checkpoint,
+                                            deletion, checker_solver, cp_propagator_class, stats))
+
+
+def _filter_sequence(seq, goal_literals, time_limit, propagator_class, caching, persistent_cache, checkpoint, deletion, checker_solver,
+                     cp_propagator_class, stats):
     seq = copy.deepcopy(seq)
-    goal_literals = frozenset(goal_literals)
 
     start_time = time()
 
     constraints = set().union(*[set(step['constraints']) for step in seq])
-    propagator = propagator_class(list(constraints), caching=True)
-    cp_propagator = CPPropagate(list(constraints), caching=False)
+    propagator = propagator_class(list(constraints), caching=caching, persistent_cache=persistent_cache, stats=stats)
+    if cp_propagator_class is None:
+        cp_propagator_class = CPPropagate if propagator.solver_name is not None else False
+    cp_propagator = None
+    if cp_propagator_class:
+        cp_propagator = cp_propagator_class(list(constraints), caching=False, encoding=propagator.encoding, stats=stats)
+
+    i = len(seq)-1
+    resume = checkpoint.resume("filter", propagator) if checkpoint is not None else None
+    if resume is not None:
+        seq = resume['seq']
+        i = resume.get('i', len(seq)-1)
+
+    # literals are encoded as bitsets internally
+    encoding = propagator.encoding
+    goal_literals = encoding.encode(goal_literals)
+    # steps are identified by their position in the initial sequence
+    step_ids = {id(step): k for k, step in enumerate(seq)}
+    # in the cache, steps are identified by their set of constraints, so steps with the same constraints share entries
+    cons_ids = dict()
+    cache_keys = [cons_ids.setdefault(frozenset(step['constraints']), len(cons_ids)) for step in seq]
+    encoded = [] # id of step -> bitset of input literals, output literals and literals over its scope
+    for step in seq:
+        encoded.append((encoding.encode(step['input']),
+                        encoding.encode(step['output']),
+                        encoding.scope_mask(get_variables(list(step['constraints'])))))
 
-    def _has_conflict(literals, seq):
-        # check if there is a conflict in the remainding constaints and given input literals
-        cons = set().union(*[step['constraints'] for step in seq])
-        return cp.Model(list(literals) + list(cons)).solve() is False
+    # conflicts in the remaining constraints are checked incrementally, constraints are identified by their index
+    constraints = list(constraints)
+    if checker_solver is None:
+        checker_solver = propagator.solver_name
+    checker = ConflictChecker(constraints, encoding, solver=checker_solver) if checker_solver else None
+    cons_idx = {cons: k for k, cons in enumerate(constraints)}
+    cons_masks = [sum(1 << cons_idx[cons] for cons in step['constraints']) for step in seq] # id of step -> bitset of constraints
 
-    unsat_sequences = dict() # cache unsat subsequences, mapping seq of constraints to set of literals
-    sat_sequences = dict() # cache sat subsequences, mapping seq of constraints to set of literals
+    # cache sat and unsat subsequences, each node of the trie holds the sets of literals of one subsequence
+    suffixes = SuffixTrie()
 
     def _try_deletion(lits_in, seq):
         # test if remaining sequence is still valid
-        subsequences = dict()  # will encounter every subsequence maximum once, save whether it is sat or unsat
-
+        if stats is not None:
+            stats.count("filter.deletion_attempts")
+        ids = [step_ids[id(step)] for step in seq]
+
+        # bitsets of literals over the scope of each suffix of the sequence, and its node in the trie
+        seq_masks = [0] * (len(seq) + 1)
+        seq_cons = [0] * (len(seq) + 1)
+        nodes = [suffixes] * (len(seq) + 1)
+        for j in reversed(range(len(seq))):
+            seq_masks[j] = seq_masks[j+1] | encoded[ids[j]][2]
+            seq_cons[j] = seq_cons[j+1] | cons_masks[ids[j]]
+            nodes[j] = nodes[j+1].child(cache_keys[ids[j]])
+
+        subsequences = [] # will encounter every subsequence maximum once, save whether it is sat or unsat
         current_lits = lits_in
         unsat = None
         for j, step in enumerate(seq):
             if time_limit - (time() - start_time) <= EPSILON:
                 raise TimeoutError("Filtering timed out")
-            
-            current_lits = frozenset(current_lits)
-            
-            str_constraints = str([x['constraints'].__repr__() for x in seq[j:]]) # string representation of constraints, used in cache
-            seq_vars = frozenset(get_variables([x['constraints'] for x in seq[j:]]))
-            seq_lits = frozenset(filter_lits_to_vars(current_lits, seq_vars))
-            
-            step_vars = frozenset(get_variables(step['constraints']))
-            step_lits = frozenset(filter_lits_to_vars(current_lits, step_vars))
-
-            assert str_constraints not in subsequences, "We encountered this sequence already, should not happen!"
-            subsequences[str_constraints] = seq_lits
-
-            if goal_literals <= current_lits:
+
+            step_input, step_output, step_mask = encoded[ids[j]]
+
+            node = nodes[j]
+            seq_lits = current_lits & seq_masks[j]
+            step_lits = current_lits & step_mask
+            subsequences.append((node, seq_lits))
+
+            if goal_literals & ~current_lits == 0:
                 # found the target, we can definitely stop
                 unsat = True
                 break
-            elif step['input'] <= current_lits:
+            elif step_input & ~current_lits == 0:
                 # we know we can deduce Rout from Rin and S, so definitely from D and S
                 # This holds for all remaining steps in the sequence assuming it was valid in the first place.
                 # So the sequence is valid
                 unsat = True
                 break
-            elif str_constraints in unsat_sequences and any(unsat_lits <= seq_lits for unsat_lits in unsat_sequences[str_constraints]):
+            elif node.unsat.has_subset(seq_lits):
                 # we decided this sequence ends in UNSAT with less literals, so this one definitely
                 unsat = True  # should never happen as input is maximal
                 break
-            elif str_constraints in sat_sequences and any(sat_lits >= seq_lits for sat_lits in sat_sequences[str_constraints]):
+            elif node.sat.has_superset(seq_lits):
                 # we decided this sequence ends in SAT with more literals, so this one definitely
                 unsat = False
                 break
-            elif step_lits == frozenset(filter_lits_to_vars(step['input'], step_vars)):
+            elif step_lits == step_input & step_mask:
                 # relevant literals are the same as original input, so no need to propagate
                 # output will be current input + original output of step
-                current_lits = step['output'] | current_lits
-                # step['output'] = current_lits | step['output']
-                # current_lits = step['output']
+                current_lits = step_output | current_lits
                 continue
-            elif _has_conflict(current_lits, seq[j:]):
+            elif checker is None or checker.has_conflict(seq_cons[j], seq_lits):
                 # there is still a conflict left based on constraints
                 # can we get there using CP-propagation?
-                lits_CP = copy.deepcopy(current_lits)
-                for x in seq[j:]:
-                    lits_CP = cp_propagator.propagate(list(lits_CP), list(x['constraints']), time_limit=time_limit - (time() - start_time))
+                lits_CP = current_lits
+                for x in (seq[j:] if cp_propagator is not None else []):
+                    lits_CP = cp_propagator.propagate_bits(lits_CP, list(x['constraints']), time_limit=time_limit - (time() - start_time))
                     # we can get the goal reduction using only CP-steps, so definitely using maxprop steps
-                    if goal_literals <= lits_CP:
+                    if goal_literals & ~lits_CP == 0:
                         unsat = True
                         break
                 if unsat is True: # reached goal using CP-propagation
                     break
                 else: # could not get goal reduction using CP-propagationg CP-propagation
                     # go to default, re-compute step using maxprop
-                    current_lits = propagator.propagate(current_lits, step['constraints'], time_limit=time_limit - (time() - start_time))       
+                    current_lits = propagator.propagate_bits(current_lits, step['constraints'], time_limit=time_limit - (time() - start_time))
             else:
                 # no conflict left in constraints, definitely not in stepwise manner either
                 unsat = False
                 break
 
         if unsat is None:
-            unsat = goal_literals <= current_lits
+            unsat = goal_literals & ~current_lits == 0
 
-        dict_to_add = unsat_sequences if unsat else sat_sequences
         # store all subsequences we encountered along the way with their initial domain
-        for seq, dom in subsequences.items():
-            if seq in dict_to_add:
-                dict_to_add[seq].add(dom)
+        for node, dom in subsequences:
+            if unsat:
+                node.unsat.add_minimal(dom)
             else:
-                dict_to_add[seq] = {dom}
+                node.sat.add_maximal(dom)
 
         return unsat
 
-    # iterate over sequence from back to front
-    i = len(seq)-1
-    while i >= 0:
-        # try deleting step i and check if still valid sequence
-        if _try_deletion(seq[i]['input'], seq[i+1:]):
-            seq.pop(i)
-        i -= 1
+    def _save(i, force=False):
+        # steps after position i are filtered, saved when the interval passed, on a timeout or when forced
+        if checkpoint is not None:
+            checkpoint.save("filter", seq, propagator=propagator, force=force or time_limit - (time() - start_time) <= EPSILON, i=i)
+
+    def _try_deletion_or_save(lits_in, seq, i):
+        # a timeout in the middle of a deletion attempt saves the progress before it
+        try:
+            return _try_deletion(lits_in, seq)
+        except TimeoutError:
+            _save(i, force=True)
+            raise
+
+    def _delete_block(lo, hi):
+        # try deleting steps lo..hi-1 at once, steps from hi onwards are already filtered
+        _save(hi-1)
+        if _try_deletion_or_save(encoded[step_ids[id(seq[lo])]][0], seq[hi:], hi-1):
+            if stats is not None:
+                stats.count("filter.deletions", hi - lo)
+            removed = seq[lo:hi]
+            del seq[lo:hi]
+            for step in removed:
+                yield dict(event="removed", stage="filter", step=step)
+        elif hi - lo > 1:
+            # some step in the block is needed, split it and filter the back half first
+            mid = (lo + hi) // 2
+            yield from _delete_block(mid, hi)
+            yield from _delete_block(lo, mid)
+
+    if deletion == "quickxplain":
+        if i >= 0:
+            yield from _delete_block(0, i+1)
+    else:
+        # iterate over sequence from back to front
+        while i >= 0:
+            _save(i)
+            # try deleting step i and check if still valid sequence
+            if _try_deletion_or_save(encoded[step_ids[id(seq[i])]][0], seq[i+1:], i):
+                if stats is not None:
+                    stats.count("filter.deletions")
+                yield dict(event="removed", stage="filter", step=seq.pop(i))
+            i -= 1
 
     # now fixup all domains in the sequence
     # set input domain to given set
 
-    current_literals = list()
+    current_literals = 0
     for i, step in enumerate(seq):
-        step["input"] = frozenset(current_literals)
-        
-        new_literals = propagator.propagate(current_literals, step['constraints'], time_limit=time_limit-(time() - start_time))
-        step["output"] = frozenset(set(new_literals) - step["input"])
+        new_literals = propagator.propagate_bits(current_literals, step['constraints'], time_limit=time_limit-(time() - start_time))
+        output = new_literals & ~current_literals
+        step["input"] = encoding.decode(current_literals)
+        step["output"] = encoding.decode(output)
 
         assert step['output'] != set(), f"Expected to be able to derive a new literal, but step {step} did not."
         
-        current_literals = list(new_literals)
+        current_literals = new_literals
 
-        if goal_literals <= step['output']:
+        if goal_literals & ~output == 0:
+            for step in seq[i+1:]:
+                yield dict(event="removed", stage="filter", step=step)
             return seq[:i+1] # can stop here
 
     return seq
 
-def relax_sequence(seq, mus_solver="ortools", time_limit=3600):
+def relax_sequence(seq, mus_solver="exact", time_limit=3600, persistent_cache=None, checkpoint=None, mode="mus", grow="greedy",
+                   stats=None):
     """
     Minimizes input literals for each step.
     Keeps a set of literals that need to be derived, only derive those in previous steps.
+    :param mus_solver: solver of the MUS engine shared by all steps, should support incremental solving under assumptions
+    :param mode: "mus" computes the input of a step with two MUS calls, first over the literals not required later on
+        and then over the required ones,
+        "ocus" computes the cheapest input in a single weighted OCUS call, where literals required later on are cheaper
+    :param grow: strategy to grow satisfiable subsets in "ocus" mode, "maxsat" or "greedy"
+    :param persistent_cache: optional path to (or PersistentCache of) an on-disk cache shared across runs
+    :param checkpoint: optional Checkpoint, the partially relaxed sequence and required literals are written to it periodically,
+        and relaxation resumes from it if it holds a loaded "relax" checkpoint
+    :param stats: optional Stats, receives the time of the stage, the MUS or OCUS calls and the propagation calls
+    """
+    return exhaust(iter_relax_sequence(seq, mus_solver=mus_solver, time_limit=time_limit, persistent_cache=persistent_cache,
+                                       checkpoint=checkpoint, mode=mode, grow=grow, stats=stats))
+
+
+def iter_relax_sequence(seq, mus_solver="exact", time_limit=3600, persistent_cache=None, checkpoint=None, mode="mus", grow="greedy",
+                        stats=None):
+    """
+        Same as `relax_sequence`, but a generator yielding `dict(event="relaxed", stage="relax", step=step, index=i)`
+            for every step as soon as its input is minimized, from the back of the sequence to the front,
+            and `dict(event="removed", stage="relax", step=step)` for steps that are not needed.
+        The index is the position of the step in the sequence given to the stage.
+        Outputs of relaxed steps can still shrink when the sequence is made pertinent at the end,
+            the sequence returned when exhausted holds the final steps. Closing the generator stops relaxation.
     """
+    assert mode in ("mus", "ocus"), f"Unknown relaxation mode {mode}"
+    with timed(stats, "relax"):
+        return (yield from _relax_sequence(seq, mus_solver, time_limit, persistent_cache, checkpoint, mode, grow, stats))
+
+
+def _relax_sequence(seq, mus_solver, time_limit, persistent_cache, checkpoint, mode, grow, stats):
     seq = copy.deepcopy(seq)
 
     start_time = time()
 
     all_constraints = set().union(*[set(step['constraints']) for step in seq])
-    propagator = ExactPropagate(constraints = list(all_constraints))
+    propagator = ExactPropagate(constraints = list(all_constraints), persistent_cache=persistent_cache, stats=stats)
 
     if len(seq) == 1:
         return seq
 
-    required = mus(soft=list(seq[-1]['input']),
-                   hard=list(seq[-1]['constraints']) + [~cp.all(list(seq[-1]['output']))],
-                   solver=mus_solver)
-    required = frozenset(required)
-    seq[-1]['input'] = required
-    i = len(seq)-2
+    # literals are encoded as bitsets internally
+    encoding = propagator.encoding
+
+    # one MUS or OCUS engine for all steps, constraints are identified by their index
+    all_constraints = list(all_constraints)
+    engine = MUSEngine(all_constraints, encoding, solver=mus_solver) if mode == "mus" else OCUSEngine(solver=mus_solver, grow=grow)
+    cons_idx = {cons: k for k, cons in enumerate(all_constraints)}
+
+    def _cons_bits(step):
+        return sum(1 << cons_idx[cons] for cons in step['constraints'])
+
+    def _mus(soft, hard, cons_bits, output):
+        if stats is not None:
+            stats.count("relax.mus_calls")
+        with timed(stats, "relax.mus"):
+            return engine.mus(soft, hard, cons_bits, output)
+
+    def _cheapest_input(step, cheap, expensive, output):
+        # the cheap literals cost 1, an expensive literal costs more than all cheap literals together
+        cheap = [encoding.lits[lit] for lit in iter_bits(cheap)]
+        expensive = [encoding.lits[lit] for lit in iter_bits(expensive)]
+        if len(cheap) + len(expensive) == 0:
+            return 0
+        soft = cheap + expensive
+        weights = np.array([1] * len(cheap) + [len(cheap) + 1] * len(expensive))
+        hard = list(step['constraints']) + [~cp.all([encoding.lits[lit] for lit in iter_bits(output)])]
+        if stats is not None:
+            stats.count("relax.ocus_calls")
+        with timed(stats, "relax.ocus"):
+            return encoding.encode(engine.ocus(soft, hard, weights=weights))
+
+    resume = checkpoint.resume("relax", propagator) if checkpoint is not None else None
+    if resume is not None and 'i' in resume:
+        seq, i, required = resume['seq'], resume['i'], encoding.encode(resume['required'])
+    else:
+        if resume is not None:
+            seq = resume['seq']
+        if mode == "mus":
+            required = _mus(soft=encoding.encode(seq[-1]['input']), hard=0,
+                            cons_bits=_cons_bits(seq[-1]), output=encoding.encode(seq[-1]['output']))
+        else:
+            required = _cheapest_input(seq[-1], encoding.encode(seq[-1]['input']), 0, encoding.encode(seq[-1]['output']))
+        seq[-1]['input'] = encoding.decode(required)
+        yield dict(event="relaxed", stage="relax", step=seq[-1], index=len(seq)-1)
+        i = len(seq)-2
 
     while i >= 0:
-        if time_limit - (time() - start_time) <= EPSILON:
+        timed_out = time_limit - (time() - start_time) <= EPSILON
+        if checkpoint is not None:
+            checkpoint.save("relax", seq, propagator=propagator, force=timed_out, i=i, required=encoding.decode(required))
+        if timed_out:
             raise TimeoutError("Relaxing sequence timed out")
-        step = seq[i]
-        # find the set of literals derived in this step we actually need later in the sequence
-        newlits = step['output'] - step['input']
-        new_required_lits = required & newlits
-        step['output'] = new_required_lits
-        if len(new_required_lits) == 0:
-            # step can be removed from sequence as no newly derived literal is required
-            # Note: this case should never occur when running on non-redundant sequences!
-            seq.pop(i)
-        else:
-            # this step derives at least one new literal needed later on in the sequence, so we have to keep it
-            # we have a preference over literals that we already need anyway
-            already_needed = step['input'] & required
-            maybe_needed = step['input'] - required
-
-            extra_required_lits = mus(soft=list(maybe_needed),
-                                      hard=list(already_needed) + list(step['constraints']) + [~cp.all(list(step['output']))],
-                                      solver=mus_solver)
-            
-            already_required_lits = mus(soft=list(already_needed),
-                                        hard=list(extra_required_lits) + list(step['constraints']) + [~cp.all(list(step['output']))],
-                                        solver=mus_solver)
-            
-            step['input'] = frozenset(already_required_lits + extra_required_lits)
-
-            # actually, we might be able to derive more than was originally "new"!
-            new_output = propagator.propagate(step['input'], step['constraints'], time_limit=time_limit - (time() - start_time))
-            step['output'] = (frozenset(new_output) - step['input']) & required
-
-            required = (required - step['output']) | step['input']
-            
+        try:
+            step = seq[i]
+            step_input = encoding.encode(step['input'])
+            # find the set of literals derived in this step we actually need later in the sequence
+            newlits = encoding.encode(step['output']) & ~step_input
+            new_required_lits = required & newlits
+            step['output'] = encoding.decode(new_required_lits)
+            if new_required_lits == 0:
+                # step can be removed from sequence as no newly derived literal is required
+                # Note: this case should never occur when running on non-redundant sequences!
+                yield dict(event="removed", stage="relax", step=seq.pop(i))
+            else:
+                # this step derives at least one new literal needed later on in the sequence, so we have to keep it
+                # we have a preference over literals that we already need anyway
+                already_needed = step_input & required
+                maybe_needed = step_input & ~required
+
+                if mode == "mus":
+                    cons_bits = _cons_bits(step)
+                    extra_required_lits = _mus(soft=maybe_needed, hard=already_needed, cons_bits=cons_bits, output=new_required_lits)
+                    already_required_lits = _mus(soft=already_needed, hard=extra_required_lits, cons_bits=cons_bits, output=new_required_lits)
+                    step_input = already_required_lits | extra_required_lits
+                else:
+                    step_input = _cheapest_input(step, already_needed, maybe_needed, new_required_lits)
+                step['input'] = encoding.decode(step_input)
+
+                # actually, we might be able to derive more than was originally "new"!
+                new_output = propagator.propagate_bits(step_input, step['constraints'], time_limit=time_limit - (time() - start_time))
+                step_output = new_output & ~step_input & required
+                step['output'] = encoding.decode(step_output)
+
+                required = (required & ~step_output) | step_input
+                yield dict(event="relaxed", stage="relax", step=step, index=i)
+        except TimeoutError:
+            # timed out while relaxing step i, steps after it are relaxed and can be resumed from
+            if checkpoint is not None:
+                checkpoint.save("relax", seq, propagator=propagator, force=True, i=i, required=encoding.decode(required))
+            raise
+
         i -= 1
     return make_pertinent(seq)
 
@@ -0,0 +1,263 @@
+import sys
+import json
+import heapq
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+ENTRY_OVERHEAD = 200 # estimated bytes used by the key and bookkeeping of one entry
+
+
+class PropagationCache:
+    """
+        Cache of propagation results.
+        Maps a set of constraints and the bitset of input literals over their scope to the bitset of propagated literals.
+        Bitsets depend on the encoding of the propagator, so a cache should not be shared between propagators.
+        Can be bounded by a maximum number of entries and/or an estimated size in bytes.
+        When full, evicts the least recently used entry ("lru"),
+            or the entry that is cheapest to recompute relative to its size ("cost", GreedyDual-Size).
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, policy="lru"):
+        assert policy in ("lru", "cost"), f"Unknown eviction policy {policy}"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+
+        self.entries = OrderedDict() # (constraints, literals) -> [propagated literals, size, cost, heap counter]
+        self.n_bytes = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+        # GreedyDual-Size bookkeeping, heap of (priority, counter, key) with lazy deletion
+        self.heap = []
+        self.inflation = 0
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, constraints, literals):
+        """
+            Returns the propagated literals stored for the constraints and input literals, or None
+        """
+        key = (constraints, literals)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == "lru":
+            self.entries.move_to_end(key)
+        else:
+            self._push(key)
+        return entry[0]
+
+    def put(self, constraints, literals, new_lits, cost=0):
+        """
+            Store the propagated literals for the constraints and input literals.
+            :param cost: time it took to compute the propagated literals, used by the "cost" policy
+        """
+        key = (constraints, literals)
+        if key in self.entries:
+            self._remove(key)
+        size = sys.getsizeof(literals) + sys.getsizeof(new_lits) + ENTRY_OVERHEAD
+        self.entries[key] = [new_lits, size, cost, 0]
+        self.n_bytes += size
+        if self.policy == "cost":
+            self._push(key)
+        self._evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.heap.clear()
+        self.n_bytes = 0
+        self.inflation = 0
+
+    def stats(self):
+        """
+            Returns the counters of the cache as dict
+        """
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    entries=len(self.entries), bytes=self.n_bytes)
+
+    def _full(self):
+        return (self.max_entries is not None and len(self.entries) > self.max_entries) or \
+               (self.max_bytes is not None and self.n_bytes > self.max_bytes)
+
+    def _push(self, key):
+        # (re-)compute priority of entry, older heap entries for the key become outdated
+        entry = self.entries[key]
+        self.counter += 1
+        entry[3] = self.counter
+        heapq.heappush(self.heap, (self.inflation + entry[2] / entry[1], self.counter, key))
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            # too many outdated heap entries, rebuild heap
+            self.heap = [item for item in self.heap if item[2] in self.entries and self.entries[item[2]][3] == item[1]]
+            heapq.heapify(self.heap)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.n_bytes -= entry[1]
+
+    def _evict(self):
+        while self._full():
+            if self.policy == "lru":
+                key = next(iter(self.entries))
+            else:
+                priority, counter, key = heapq.heappop(self.heap)
+                if key not in self.entries or self.entries[key][3] != counter:
+                    continue # outdated heap entry
+                self.inflation = priority
+            self._remove(key)
+            self.evictions += 1
+
+
+class SolutionPool:
+    """
+        Assignments found by propagators that enumerate solutions, each with the constraints it satisfies.
+        An assignment is a bitset with the bit of literal `var != val` set for the value `val` assigned to `var`,
+            so it supports the values in the bitset and is consistent with literals it does not intersect.
+        Assignments are indexed by the constraints they satisfy, so the ones satisfying a subset of constraints are found
+            without scanning all of them. Like a PropagationCache, a pool can only be shared between propagators with the same encoding.
+        Can be bounded by a maximum number of assignments, the oldest assignments are removed first.
+    """
+
+    def __init__(self, max_solutions=None):
+        self.max_solutions = max_solutions
+        self.solutions = OrderedDict() # id -> (assignment, constraints)
+        self.satisfied_by = dict() # constraint -> ids of assignments satisfying it
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.solutions)
+
+    def add(self, constraints, assignment):
+        """
+            Store an assignment satisfying all given constraints
+        """
+        self.counter += 1
+        self.solutions[self.counter] = (assignment, frozenset(constraints))
+        for cons in constraints:
+            self.satisfied_by.setdefault(cons, set()).add(self.counter)
+        while self.max_solutions is not None and len(self.solutions) > self.max_solutions:
+            old_id, (_, old_constraints) = self.solutions.popitem(last=False)
+            for cons in old_constraints:
+                self.satisfied_by[cons].discard(old_id)
+
+    def supported(self, constraints, literals):
+        """
+            Returns the union of all stored assignments that satisfy the constraints and are consistent with the literals
+        """
+        if len(constraints) == 0:
+            return 0
+        # intersect the smallest sets first
+        ids = None
+        for cons in sorted(constraints, key=lambda cons: len(self.satisfied_by.get(cons, ()))):
+            ids = set(self.satisfied_by.get(cons, ())) if ids is None else ids & self.satisfied_by[cons]
+            if len(ids) == 0:
+                return 0
+
+        supported = 0
+        for i in ids:
+            assignment = self.solutions[i][0]
+            if assignment & literals == 0:
+                supported |= assignment
+        return supported
+
+    def clear(self):
+        self.solutions.clear()
+        self.satisfied_by.clear()
+
+
+class PersistentCache:
+    """
+        On-disk cache of propagation results, shared across runs and processes.
+        Keys are canonical fingerprints of the set of constraints and of the input literals over their scope,
+            values are the propagated literals as list of (variable name, value) pairs, or None for UNSAT.
+        Backed by SQLite in WAL mode, so concurrent processes can read while one of them writes.
+        New entries are written in batches of `batch_size`, each batch in one transaction, and on `flush` or `close`.
+            Entries of an unfinished batch are lost if the process is killed, which only costs propagating them again.
+        Pickling only keeps the path and options, every process opens its own connection.
+    """
+
+    def __init__(self, path, timeout=60, batch_size=100):
+        self.path = path
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.hits, self.misses = 0, 0
+        self._connection = None
+        self._pending = dict() # (constraints, literals) -> result as JSON, not written yet
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS propagation "
+                                     "(constraints TEXT, literals TEXT, result TEXT, PRIMARY KEY (constraints, literals))")
+        return self._connection
+
+    @staticmethod
+    def fingerprint(strings):
+        """
+            Canonical fingerprint of a collection of strings, independent of their order
+        """
+        return hashlib.sha1("\n".join(sorted(strings)).encode()).hexdigest()
+
+    def get(self, constraints, literals):
+        """
+            Returns the stored result for the fingerprints of constraints and literals, or False if not stored
+        """
+        if (constraints, literals) in self._pending:
+            self.hits += 1
+            return json.loads(self._pending[(constraints, literals)])
+        row = self.connection.execute("SELECT result FROM propagation WHERE constraints=? AND literals=?",
+                                      (constraints, literals)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, constraints, literals, result):
+        self._pending[(constraints, literals)] = json.dumps(result)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+            Write the pending entries in one transaction
+        """
+        if len(self._pending) == 0:
+            return
+        connection = self.connection
+        connection.execute("BEGIN")
+        connection.executemany("INSERT OR IGNORE INTO propagation VALUES (?, ?, ?)",
+                               [(constraints, literals, result) for (constraints, literals), result in self._pending.items()])
+        connection.execute("COMMIT")
+        self._pending.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __getstate__(self):
+        return dict(path=self.path, timeout=self.timeout, batch_size=self.batch_size)
+
+    def __del__(self):
+        # propagators given a path own their cache, pending entries are written when it is garbage collected
+        try:
+            self.close()
+        except sqlite3.Error:
+            pass
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -0,0 +1,118 @@
+import os
+import pickle
+from time import time
+
+from cpmpy.expressions.core import BoolVal
+from cpmpy.transformations.normalize import toplevel_list
+
+from .utils import get_variables
+from .cache import PersistentCache
+from .datastructures import UNSAT_BIT
+
+STAGES = ("greedy", "filter", "relax", "done")
+
+
+class Checkpoint:
+    """
+        Periodically writes the progress of the stages of `find_sequence` to disk, so they can be resumed after an interruption.
+        Only plain data is written: constraints by their string representation, literals as (variable name, value) pairs.
+        This way, a checkpoint can be loaded in a new process, with the constraints of a freshly built model.
+        A stage saves its partial sequence and position, and optionally the entries of the cache of its propagator.
+    """
+
+    def __init__(self, path, constraints, interval=60, include_cache=False):
+        self.path = path
+        self.interval = interval # minimum number of seconds between two writes
+        self.include_cache = include_cache
+        self.last_write = time()
+
+        self.constraints = toplevel_list(constraints, merge_and=False)
+        self.cons_by_str = {str(cons): cons for cons in self.constraints}
+        self.vars_by_name = {var.name: var for var in get_variables(self.constraints)}
+        self.fingerprint = PersistentCache.fingerprint(self.cons_by_str)
+
+        self.stage = None # stage of the loaded checkpoint
+        self.state = None # state of the loaded checkpoint
+
+    def load(self, path=None):
+        """
+            Load the checkpoint at the path, returns the stage it should be resumed from
+        """
+        path = path if path is not None else self.path
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data['fingerprint'] != self.fingerprint:
+            raise ValueError(f"Checkpoint {path} was written for a different set of constraints")
+        self.stage = data['stage']
+        self.state = data
+        return self.stage
+
+    def sequence(self):
+        """
+            Returns the sequence of the loaded checkpoint
+        """
+        return [self._decode_step(step) for step in self.state['seq']]
+
+    def resume(self, stage, propagator=None):
+        """
+            Returns the sequence and position the stage should resume from, or None if the loaded checkpoint is not for this stage.
+            Fills the cache of the propagator with the stored entries.
+            The loaded state is only returned once.
+        """
+        if self.state is None or self.stage != stage:
+            return None
+        state, self.state = self.state, None
+        if propagator is not None and propagator.cache is not None:
+            for constraints, literals, new_lits in state['cache']:
+                propagator.cache.put(frozenset(self.cons_by_str[cons] for cons in constraints),
+                                     propagator.encoding.encode(self._decode_lits(literals)),
+                                     UNSAT_BIT if new_lits is None else propagator.encoding.encode(self._decode_lits(new_lits)))
+        position = {key: self._decode_lits(val) if isinstance(val, list) else val for key, val in state['position'].items()}
+        return dict(seq=[self._decode_step(step) for step in state['seq']], **position)
+
+    def save(self, stage, seq, propagator=None, force=False, **position):
+        """
+            Write the partial sequence and position of a stage, if the last write is at least `interval` seconds ago.
+            Literals in the position are given as set of CPMpy literals, other values should be plain Python objects.
+        """
+        assert stage in STAGES, f"Unknown stage {stage}"
+        if not force and time() - self.last_write < self.interval:
+            return False
+
+        cache = []
+        if self.include_cache and propagator is not None and propagator.cache is not None:
+            encoding = propagator.encoding
+            for (constraints, literals), entry in propagator.cache.entries.items():
+                new_lits = None if entry[0] == UNSAT_BIT else self._encode_lits(encoding.decode(entry[0]))
+                cache.append(([str(cons) for cons in constraints], self._encode_lits(encoding.decode(literals)), new_lits))
+
+        data = dict(fingerprint=self.fingerprint,
+                    stage=stage,
+                    seq=[self._encode_step(step) for step in seq],
+                    position={key: self._encode_lits(val) if isinstance(val, (set, frozenset)) else val
+                              for key, val in position.items()},
+                    cache=cache)
+
+        # write to a temporary file first, so an interruption while writing does not corrupt the checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, self.path)
+        self.last_write = time()
+        return True
+
+    def _encode_lits(self, literals):
+        # the literal False is stored as (None, 0)
+        pairs = [(None, 0) if isinstance(lit, BoolVal) else (lit.args[0].name, int(lit.args[1])) for lit in literals]
+        return sorted(pairs, key=lambda pair: (pair[0] is not None, pair))
+
+    def _decode_lits(self, literals):
+        return frozenset(BoolVal(False) if name is None else self.vars_by_name[name] != val for name, val in literals)
+
+    def _encode_step(self, step):
+        return dict(step, input=self._encode_lits(step['input']), output=self._encode_lits(step['output']),
+                    constraints=sorted(str(cons) for cons in step['constraints']))
+
+    def _decode_step(self, step):
+        return dict(step, input=self._decode_lits(step['input']), output=self._decode_lits(step['output']),
+                    constraints=frozenset(self.cons_by_str[cons] for cons in step['constraints']))
@@ -0,0 +1,394 @@
+from cpmpy.expressions.core import BoolVal, Comparison
+
+from .utils import get_variables
+
+
+UNSAT_BIT = 1 # bitset of the literal False
+
+
+def iter_bits(bits):
+    """
+        Yields the positions of all set bits in a bitset
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class LiteralEncoding:
+    """
+        Integer encoding of literals `var != val`, sets of literals are represented as bitsets (Python ints).
+        Every variable gets a block of consecutive bits, one for each value in its domain.
+        Bit 0 is reserved for the literal False, so UNSAT is represented by UNSAT_BIT.
+        Variables are added on first use, bitsets stay valid when new variables are encoded.
+        Conversion to and from CPMpy literals should only happen at the API boundary of the algorithms.
+    """
+
+    def __init__(self, vars=()):
+        self.vars = [] # variable index -> variable
+        self.var_idx = dict() # variable -> variable index
+        self.offsets = [] # variable index -> position of first bit
+        self.masks = [] # variable index -> bitset of all literals of the variable
+        self.lits = [BoolVal(False)] # bit -> CPMpy literal
+        self.lit_var = [None] # bit -> variable index
+        for var in vars:
+            self.index(var)
+
+    def index(self, var):
+        """
+            Returns the index of a variable, adds it to the encoding if it is not encoded yet
+        """
+        idx = self.var_idx.get(var)
+        if idx is None:
+            idx = len(self.vars)
+            self.vars.append(var)
+            self.var_idx[var] = idx
+            self.offsets.append(len(self.lits))
+            self.masks.append(((1 << (var.ub - var.lb + 1)) - 1) << len(self.lits))
+            self.lits += [var != val for val in range(var.lb, var.ub + 1)]
+            self.lit_var += [idx] * (var.ub - var.lb + 1)
+        return idx
+
+    def bit(self, lit):
+        """
+            Returns the position of the bit of a CPMpy literal `var != val`, or False
+        """
+        if isinstance(lit, BoolVal):
+            assert lit.value() is False, f"Only the literal False can be encoded, but got {lit}"
+            return 0
+        assert isinstance(lit, Comparison) and lit.name == "!=", f"Expected literal of the form `var != val`, but got {lit}"
+        var, val = lit.args
+        idx = self.index(var)
+        assert var.lb <= val <= var.ub, f"Value of literal {lit} is not in the domain of its variable"
+        return self.offsets[idx] + int(val) - var.lb
+
+    def encode(self, literals):
+        """
+            Convert a collection of CPMpy literals to a bitset
+        """
+        bits = 0
+        for lit in literals:
+            bits |= 1 << self.bit(lit)
+        return bits
+
+    def decode(self, bits):
+        """
+            Convert a bitset to a frozenset of CPMpy literals
+        """
+        return frozenset(self.lits[i] for i in iter_bits(bits))
+
+    def scope_mask(self, vars):
+        """
+            Returns the bitset of all literals over the given variables
+        """
+        mask = 0
+        for var in vars:
+            mask |= self.masks[self.index(var)]
+        return mask
+
+    def variables(self, bits):
+        """
+            Returns the variables with a literal in the bitset, i.e., the variables with a reduced domain
+        """
+        return [self.vars[idx] for idx in sorted({self.lit_var[i] for i in iter_bits(bits & ~UNSAT_BIT)})]
+
+    def domain(self, bits, var):
+        """
+            Returns the values of a variable that are not excluded by the literals in the bitset
+        """
+        return self.values(self.masks[self.index(var)] & ~bits, var)
+
+    def values(self, bits, var):
+        """
+            Returns the values of a variable whose literal is in the bitset
+        """
+        idx = self.index(var)
+        var_bits = (bits & self.masks[idx]) >> self.offsets[idx]
+        return [val for i, val in enumerate(range(var.lb, var.ub + 1)) if (var_bits >> i) & 1]
+
+    def exclude(self, var, values):
+        """
+            Returns the bitset of literals `var != val` for all given values
+        """
+        offset = self.offsets[self.index(var)] - var.lb
+        bits = 0
+        for val in values:
+            bits |= 1 << (offset + int(val))
+        return bits
+
+    def restrict(self, var, values):
+        """
+            Returns the bitset of literals excluding all values of a variable, except the given ones
+        """
+        return self.masks[self.index(var)] & ~self.exclude(var, values)
+
+
+class ConstraintGraph:
+    """
+        Hypergraph over the constraints and variables of a model.
+        Constraints are identified by their index in the list of constraints,
+            two constraints are neighbours if their scopes share a variable.
+        Built once per model, so scopes are only computed once.
+    """
+
+    def __init__(self, constraints):
+        self.constraints = list(constraints)
+        self.scopes = [frozenset(get_variables(cons)) for cons in self.constraints]
+
+        self.occurs_in = dict() # variable -> indices of constraints it occurs in
+        for i, scope in enumerate(self.scopes):
+            for var in scope:
+                self.occurs_in.setdefault(var, set()).add(i)
+
+        self.neighbours = [frozenset().union(*[self.occurs_in[var] for var in scope]) - {i}
+                           for i, scope in enumerate(self.scopes)]
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def scope(self, idxes):
+        """
+            Returns the variables in the scope of the constraints with given indices
+        """
+        return frozenset().union(*[self.scopes[i] for i in idxes])
+
+    def is_connected(self, idxes):
+        """
+            Returns if the constraints with given indices form a connected network
+        """
+        idxes = set(idxes)
+        if len(idxes) <= 1:
+            return True # shortcut
+        to_visit = {next(iter(idxes))}
+        visited = set()
+        while len(to_visit):
+            i = to_visit.pop()
+            visited.add(i)
+            to_visit |= (self.neighbours[i] & idxes) - visited
+        return len(visited) == len(idxes)
+
+    def connected_subsets(self, size):
+        """
+            Lazily yields all connected subsets of `size` constraints as sorted tuples of indices.
+            Subsets are grown along shared variables (ESU algorithm, Wernicke 2006), so every connected subset
+                is visited exactly once and disconnected subsets are never generated.
+            The order is deterministic, but not lexicographic.
+        """
+        for root in range(len(self.constraints)):
+            # all subsets found from this root have it as smallest index
+            extension = {i for i in self.neighbours[root] if i > root}
+            border = self.neighbours[root] | {root}
+            for subset in self._extend((root,), extension, border, root, size):
+                yield tuple(sorted(subset))
+
+    def _extend(self, subset, extension, border, root, size):
+        if len(subset) == size:
+            yield subset
+            return
+        extension = set(extension)
+        while len(extension):
+            i = min(extension)
+            extension.remove(i)
+            # only extend with exclusive neighbours of i, those are not reachable from the current subset
+            new_extension = extension | {j for j in self.neighbours[i] if j > root and j not in border}
+            yield from self._extend(subset + (i,), new_extension, border | self.neighbours[i], root, size)
+
+
+class Fixpoint:
+    """
+        Subsets of constraints known to propagate nothing under the current literals, mapped to their scope.
+        Indexed by variable, so subsets touching a variable with a reduced domain are found without scanning all of them.
+    """
+
+    def __init__(self):
+        self.scopes = dict() # subset of constraints -> scope
+        self.subsets_of = dict() # variable -> subsets of constraints with that variable in their scope
+
+    def __len__(self):
+        return len(self.scopes)
+
+    def __contains__(self, subset):
+        return subset in self.scopes
+
+    def __getitem__(self, subset):
+        return self.scopes[subset]
+
+    def __setitem__(self, subset, scope):
+        self.scopes[subset] = scope
+        for var in scope:
+            self.subsets_of.setdefault(var, set()).add(subset)
+
+    def invalidate(self, variables):
+        """
+            Remove all subsets with any of the given variables in their scope
+        """
+        for var in variables:
+            for subset in self.subsets_of.pop(var, set()):
+                for other in self.scopes.pop(subset, frozenset()):
+                    if other in self.subsets_of:
+                        self.subsets_of[other].discard(subset)
+
+
+class SetTrie:
+    """
+        Set-trie over bitsets, answers whether a stored set is a subset or superset of a query set
+            without scanning all stored sets (Savnik, 2013).
+        A set is stored as the path of its elements in increasing order.
+        `add_minimal` and `add_maximal` only keep the minimal or maximal stored sets, so dominated sets do not pile up.
+        Searches use an explicit stack, as paths can be longer than the recursion limit.
+    """
+
+    __slots__ = ("children", "end")
+
+    def __init__(self):
+        self.children = dict() # element -> node
+        self.end = False # a stored set ends in this node
+
+    def __iter__(self):
+        stack = [(self, 0)]
+        while len(stack):
+            node, bits = stack.pop()
+            if node.end:
+                yield bits
+            stack += [(child, bits | (1 << elem)) for elem, child in node.children.items()]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def add(self, bits):
+        node = self
+        for elem in iter_bits(bits):
+            node = node.children.setdefault(elem, SetTrie())
+        node.end = True
+
+    def remove(self, bits):
+        elems = list(iter_bits(bits))
+        path = [self]
+        for elem in elems:
+            path.append(path[-1].children[elem])
+        path[-1].end = False
+        # prune nodes that no longer lead to a stored set
+        for k in reversed(range(len(elems))):
+            if path[k+1].end or len(path[k+1].children):
+                break
+            del path[k].children[elems[k]]
+
+    def subsets(self, bits):
+        """
+            Returns all stored subsets of the bitset
+        """
+        elems = list(iter_bits(bits))
+        found, stack = [], [(self, 0, 0)]
+        while len(stack):
+            node, i, prefix = stack.pop()
+            if node.end:
+                found.append(prefix)
+            for j in range(i, len(elems)):
+                child = node.children.get(elems[j])
+                if child is not None:
+                    stack.append((child, j + 1, prefix | (1 << elems[j])))
+        return found
+
+    def supersets(self, bits):
+        """
+            Returns all stored supersets of the bitset
+        """
+        elems = list(iter_bits(bits))
+        found, stack = [], [(self, 0, 0)]
+        while len(stack):
+            node, i, prefix = stack.pop()
+            if i == len(elems):
+                found += [prefix | rest for rest in node]
+                continue
+            for elem, child in node.children.items():
+                if elem < elems[i]:
+                    stack.append((child, i, prefix | (1 << elem)))
+                elif elem == elems[i]:
+                    stack.append((child, i + 1, prefix | (1 << elem)))
+        return found
+
+    def has_subset(self, bits):
+        """
+            Returns if any stored set is a subset of the bitset
+        """
+        elems = list(iter_bits(bits))
+        stack = [(self, 0)]
+        while len(stack):
+            node, i = stack.pop()
+            if node.end:
+                return True
+            for j in range(i, len(elems)):
+                child = node.children.get(elems[j])
+                if child is not None:
+                    stack.append((child, j + 1))
+        return False
+
+    def has_superset(self, bits):
+        """
+            Returns if any stored set is a superset of the bitset
+        """
+        elems = list(iter_bits(bits))
+        stack = [(self, 0)]
+        while len(stack):
+            node, i = stack.pop()
+            if i == len(elems):
+                if node.end or len(node.children):
+                    return True # all nodes lead to a stored set
+                continue
+            for elem, child in node.children.items():
+                if elem < elems[i]:
+                    stack.append((child, i))
+                elif elem == elems[i]:
+                    stack.append((child, i + 1))
+        return False
+
+    def add_minimal(self, bits):
+        """
+            Store the bitset unless a subset of it is stored, and remove all stored supersets of it.
+            Returns if the bitset is stored.
+        """
+        if self.has_subset(bits):
+            return False
+        for superset in self.supersets(bits):
+            self.remove(superset)
+        self.add(bits)
+        return True
+
+    def add_maximal(self, bits):
+        """
+            Store the bitset unless a superset of it is stored, and remove all stored subsets of it.
+            Returns if the bitset is stored.
+        """
+        if self.has_superset(bits):
+            return False
+        for subset in self.subsets(bits):
+            self.remove(subset)
+        self.add(bits)
+        return True
+
+
+class SuffixTrie:
+    """
+        Trie over sequences of step ids, read from the back of the sequence to the front.
+        The node of a suffix `seq[j:]` is the child of the node of `seq[j+1:]` for the id of step j,
+            so the nodes of all suffixes of a sequence are found in one pass from back to front.
+        Each node holds the bitsets of input literals for which its subsequence is known to reach the goal (unsat) or not (sat),
+            in a SetTrie keeping only the minimal unsat and maximal sat sets.
+    """
+
+    __slots__ = ("children", "unsat", "sat")
+
+    def __init__(self):
+        self.children = dict() # step id -> node
+        self.unsat = SetTrie()
+        self.sat = SetTrie()
+
+    def child(self, step_id):
+        """
+            Returns the node of the sequence extended at the front with the step, adds it if it does not exist yet
+        """
+        node = self.children.get(step_id)
+        if node is None:
+            node = self.children[step_id] = SuffixTrie()
+        return node
@@ -1,6 +1,9 @@
 from time import time
 import logging
-from itertools import combinations
+import multiprocessing
+import signal
+from multiprocessing.util import Finalize
+from itertools import islice
 
 import random
 import numpy as np
@@ -8,78 +11,201 @@ import numpy as np
 from cpmpy.transformations.get_variables import get_variables
 from cpmpy.transformations.normalize import toplevel_list
 
-from .utils import EPSILON
+from .utils import EPSILON, exhaust
+from .datastructures import ConstraintGraph, Fixpoint, LiteralEncoding, UNSAT_BIT
 from .propagate import MaximalPropagate, ExactPropagate
-import cpmpy as cp
+from .stats import timed
 
 
-def connected_network(constraints):
+# state of worker processes in a PropagatorPool
+_worker_constraints = None
+_worker_propagator = None
+
+def _init_worker(PROP, constraints, caching, persistent_cache):
+    global _worker_constraints, _worker_propagator
+    _worker_constraints = constraints
+    _worker_propagator = PROP(constraints=constraints, caching=caching, persistent_cache=persistent_cache)
+    # Exact installs a handler for SIGTERM when a solver is created, which keeps idle workers alive on `Pool.terminate`
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if _worker_propagator.persistent_cache is not None:
+        # workers exit without garbage collecting their propagator, write the pending entries of the persistent cache on exit
+        Finalize(None, _worker_propagator.persistent_cache.flush, exitpriority=0)
+
+def _propagate_chunk(literals, chunk, time_limit):
+    """
+        Propagate a chunk of candidates, given as tuples of constraint indices, in a worker process, in order.
+        Returns the position of the first candidate that propagates something new, its propagated literals
+            and the positions of candidates that propagated nothing.
     """
-    Returns if the constraint network is connected or not
+    nothing_new = []
+    subsets = ([_worker_constraints[i] for i in idxes] for idxes in chunk)
+    for j, propagated_lits in enumerate(_worker_propagator.iter_propagate_bits(literals, subsets, time_limit=time_limit)):
+        if propagated_lits == literals:
+            nothing_new.append(j)
+        else:
+            return j, propagated_lits, nothing_new
+    return None, None, nothing_new
+
+
+class PropagatorPool:
     """
-    if len(constraints) == 1:
-        return True # shortcut
-    scopes = {cons : set(get_variables(cons)) for cons in constraints}
-    occurs_in = {var : {c for c in constraints if var in scopes[c]} for var in set().union(*scopes.values())}
-    # start at a random constraint and a random variable
-    to_visit = {next(iter(scopes[constraints[0]]))}
-    visited = set()
-    while len(to_visit):
-        # try constructing path over constraint graph that visits all
-        to_visit -= visited
-        var = to_visit.pop()
-        # else, var not visisted, add all new vars to frontier reachable from this one using any constraint
-        visited.add(var)
-        for cons in occurs_in[var]:
-            to_visit |= scopes[cons] - visited
-    return len(visited) == len(set().union(*scopes.values()))
-
-
-
-def smallest_next_step(current_literals, constraints, propagator, time_limit=3600):
+        Pool of worker processes, each holding its own propagator built from the same list of constraints.
+        Candidate subsets of constraints are spread over the workers in chunks.
+        All workers encode literals the same way as `self.encoding`, so literals are sent as bitsets.
+        Workers are started with the "spawn" method, so no solver state of the parent process is inherited.
+    """
+
+    def __init__(self, constraints, PROP=ExactPropagate, n_workers=None, chunk_size=8, caching=True, persistent_cache=None):
+        self.constraints = list(constraints)
+        self.encoding = LiteralEncoding(get_variables(self.constraints))
+        self.n_workers = n_workers if n_workers is not None else multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.wave_size = self.n_workers * self.chunk_size # number of candidates propagated in one go
+        ctx = multiprocessing.get_context("spawn")
+        self.pool = ctx.Pool(self.n_workers, initializer=_init_worker, initargs=(PROP, self.constraints, caching, persistent_cache))
+
+    def first_propagating(self, literals, candidates, time_limit=3600):
+        """
+            Propagate a wave of candidate subsets of constraints, given as tuples of constraint indices.
+            Each worker gets one chunk of the wave, so the first candidate in the wave that propagates something new
+                is found, as when propagating them one by one.
+            :return: the first propagating candidate (or None), its propagated literals as bitset and
+                the candidates that propagated nothing
+        """
+        chunks = [candidates[i:i+self.chunk_size] for i in range(0, len(candidates), self.chunk_size)]
+        results = self.pool.starmap(_propagate_chunk, [(literals, chunk, time_limit) for chunk in chunks])
+
+        nothing_new = [chunk[j] for chunk, (_, _, nothing) in zip(chunks, results) for j in nothing]
+        for chunk, (j, propagated_lits, _) in zip(chunks, results):
+            if j is not None: # results are in order of the chunks, so this is the first one
+                return chunk[j], propagated_lits, nothing_new
+        return None, None, nothing_new
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def _propagated_new(literals, propagated_lits):
+    """
+        Check if the propagated literals contain something new compared to the input literals, both given as bitsets
+    """
+    if propagated_lits == literals:
+        return False
+    elif literals & ~propagated_lits == 0 or propagated_lits == UNSAT_BIT: # found some new literals
+        return True
+    raise ValueError("The propagated domains are not a subset of the original domains, this should not happen!")
+
+
+def smallest_next_step(current_literals, constraints, propagator, time_limit=3600, fixpoint=None, graph=None, pool=None, scheduler=None):
     """
     Computes the smallest next step given input domains and a list of constraints.
-    Iterate over all subsets of constraints and check if anything can be propagated
+    Iterate over all connected subsets of constraints and check if anything can be propagated
     :param domains: a set of literals that describes the current domains
     :param constraints: a list of CPMpy constraints
-    :param propagator: a propagator, can be maximal but not required
+    :param propagator: a propagator, can be maximal but not required. Not used when a pool is given.
+    :param fixpoint: optional Fixpoint mapping subsets of constraints known to propagate nothing to their scope.
+        These subsets are skipped, and newly found subsets that propagate nothing are added to it.
+    :param graph: optional ConstraintGraph of the constraints, avoids rebuilding it on every call
+    :param pool: optional PropagatorPool built from the constraints, propagates subsets in parallel
+    :param scheduler: optional CandidateScheduler deciding the order of the candidates of each size,
+        by default they are propagated in the order of enumeration
     :return: a tuple of constraints and the new literals implied by it, given the input literals
     """
+    encoding = propagator.encoding if pool is None else pool.encoding
+    cons, propagated_lits = _smallest_next_step(encoding.encode(current_literals), constraints, propagator,
+                                                time_limit=time_limit, fixpoint=fixpoint, graph=graph, pool=pool,
+                                                scheduler=scheduler)
+    return cons, list(encoding.decode(propagated_lits))
 
+
+def _smallest_next_step(literals, constraints, propagator, time_limit=3600, fixpoint=None, graph=None, pool=None, scheduler=None):
+    """
+        Same as `smallest_next_step`, but literals are given and returned as bitset
+    """
     start_time = time()
-    literals_set = frozenset(current_literals)
 
-    sorted(constraints, key=lambda x: str(x))
-    candidates = []
+    if graph is None:
+        graph = ConstraintGraph(constraints)
+    assert len(graph) == len(constraints), "Constraint graph should be built from the given constraints"
+
     for size in range(1,len(constraints)+1):
         logging.info(f"Propagating constraint sets of size {size}")
         #print(f"Propagating constraint sets of size {size}")
 
-        for i, cons in enumerate(combinations(constraints,size)):
-            if time_limit - (time() - start_time) <= EPSILON:
-                raise TimeoutError(f"'smallest_next_step' timed out after {time() - start_time} seconds")
-            if size == 2:               
-                if set(get_variables(cons[0])).isdisjoint(set(get_variables(cons[1]))):
-                    # quick check if scopes are disjoint
-                    continue # will never propagate anything new compared to single constraints
-            elif not connected_network(cons):
-                continue # will never propagate anything new compared to its strict subsets (which are already checked in previous iteration)
-
-            propagated_lits = frozenset(propagator.propagate(current_literals, list(cons), time_limit=time_limit -(time() - start_time)))
-            if propagated_lits == literals_set:
-                # nothing propagated, skip
-                continue                
-            elif literals_set < propagated_lits or propagated_lits == frozenset([cp.BoolVal(False)]): # found some new literals
+        # disconnected subsets will never propagate anything new compared to their strict subsets,
+        # (which are already checked in previous iteration) so only enumerate connected ones
+        candidates = (idxes for idxes in graph.connected_subsets(size)
+                      # skip subsets that propagated nothing before and no variable in its scope changed since
+                      if fixpoint is None or tuple(constraints[i] for i in idxes) not in fixpoint)
+        if scheduler is not None:
+            candidates = iter(scheduler.order(candidates, literals))
+
+        if pool is not None:
+            while 1:
+                if time_limit - (time() - start_time) <= EPSILON:
+                    raise TimeoutError(f"'smallest_next_step' timed out after {time() - start_time} seconds")
+                wave = list(islice(candidates, pool.wave_size))
+                if len(wave) == 0:
+                    break
+                idxes, propagated_lits, nothing_new = pool.first_propagating(literals, wave, time_limit=time_limit - (time() - start_time))
+                if fixpoint is not None:
+                    for subset in nothing_new:
+                        fixpoint[tuple(constraints[i] for i in subset)] = graph.scope(subset)
+                if idxes is not None and _propagated_new(literals, propagated_lits):
+                    return [constraints[i] for i in idxes], propagated_lits
+            continue
+
+        # all candidates share the same input literals, so propagate them as one batch
+        subsets = [] # candidates in the order they are propagated
+        def _subsets():
+            for idxes in candidates:
+                if time_limit - (time() - start_time) <= EPSILON:
+                    raise TimeoutError(f"'smallest_next_step' timed out after {time() - start_time} seconds")
+                subsets.append(idxes)
+                yield [constraints[i] for i in idxes]
+
+        results = propagator.iter_propagate_bits(literals, _subsets(), time_limit=time_limit - (time() - start_time))
+        for propagated_lits, idxes in zip(results, subsets): # results come first, as they extend the list of subsets
+            cons = tuple(constraints[i] for i in idxes)
+            if _propagated_new(literals, propagated_lits):
                 # propagated something new, keep step
-                return list(cons), list(propagated_lits)
-            else:
-                raise ValueError("The propagated domains are not a subset of the original domains, this should not happen!")
-        if len(candidates):
-            break # found all steps of smallest size, no need to test bigger steps!
+                return list(cons), propagated_lits
+            elif fixpoint is not None:
+                # nothing propagated, skip
+                fixpoint[cons] = graph.scope(idxes)
     raise ValueError("Exhausted all subsets of constraints without sucessfull propagation, is the propagator maximal?")
 
 
-def construct_greedy(constraints, goal_literals, time_limit, seed, PROP=ExactPropagate):
+def construct_greedy(constraints, goal_literals, time_limit, seed, PROP=ExactPropagate, n_workers=1, caching=True, persistent_cache=None,
+                     scheduler=None, checkpoint=None, stats=None):
+    """
+    Greedily construct a sequence by repeatedly adding the smallest next step.
+    :param n_workers: number of worker processes used to propagate candidate steps,
+        each worker builds its own propagator. Defaults to 1, which propagates in this process.
+    :param caching: caching policy of the propagator(s), True, False or a PropagationCache with bounded size
+    :param persistent_cache: optional path to (or PersistentCache of) an on-disk cache shared across runs
+    :param scheduler: optional CandidateScheduler class, e.g. SuccessPriorScheduler, deciding which candidate steps
+        of the same size are propagated first. Defaults to the order of enumeration.
+    :param checkpoint: optional Checkpoint, the partial sequence is written to it periodically,
+        and construction resumes from it if it holds a loaded "greedy" checkpoint
+    :param stats: optional Stats, receives the time of the stage and of each step, and the propagation calls of this process
+    """
+    return exhaust(iter_construct_greedy(constraints, goal_literals, time_limit, seed, PROP=PROP, n_workers=n_workers, caching=caching,
+                                         persistent_cache=persistent_cache, scheduler=scheduler, checkpoint=checkpoint, stats=stats))
+
+
+def iter_construct_greedy(constraints, goal_literals, time_limit, seed, PROP=ExactPropagate, n_workers=1, caching=True, persistent_cache=None,
+                          scheduler=None, checkpoint=None, stats=None):
+    """
+        Same as `construct_greedy`, but a generator yielding `dict(event="step", stage="greedy", step=step)`
+            for every step as soon as it is added to the sequence, steps of a resumed checkpoint first.
+        Returns the sequence when exhausted, closing the generator stops the construction.
+    """
 
     # normalize constraints
     constraints = toplevel_list(constraints, merge_and=False)
@@ -88,30 +214,83 @@ def construct_greedy(constraints, goal_literals, time_limit, seed, PROP=ExactPro
     random.seed(seed)
     np.random.seed(seed)
 
-    max_propagator = PROP(constraints=constraints, caching=True)
+    graph = ConstraintGraph(constraints)
+    if n_workers > 1:
+        max_propagator, pool = None, PropagatorPool(constraints, PROP=PROP, n_workers=n_workers,
+                                                      caching=caching, persistent_cache=persistent_cache)
+    else:
+        max_propagator, pool = PROP(constraints=constraints, caching=caching, persistent_cache=persistent_cache, stats=stats), None
+    if scheduler is not None:
+        scheduler = scheduler(graph, max_propagator.encoding if pool is None else pool.encoding)
+
+    try:
+        with timed(stats, "greedy"):
+            seq = yield from _construct_greedy(constraints, goal_literals, time_limit, start_time, max_propagator, graph, pool,
+                                               scheduler, checkpoint, stats)
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    if pool is not None:
+        pool.close()
+    return seq
+
+
+def _construct_greedy(constraints, goal_literals, time_limit, start_time, max_propagator, graph, pool, scheduler, checkpoint, stats=None):
+    encoding = max_propagator.encoding if pool is None else pool.encoding
+    goal_literals = encoding.encode(goal_literals)
     seq = []
 
-    literals = set()
+    literals = 0
+    resume = checkpoint.resume("greedy", max_propagator) if checkpoint is not None else None
+    if resume is not None:
+        seq, literals = resume['seq'], encoding.encode(resume['literals'])
+        for step in seq:
+            yield dict(event="step", stage="greedy", step=step)
+
+    fixpoint = Fixpoint() # subsets of constraints that propagated nothing, mapped to their scope
     while 1:
-        if time_limit - (time() - start_time) <= EPSILON:
+        timed_out = time_limit - (time() - start_time) <= EPSILON
+        if checkpoint is not None:
+            checkpoint.save("greedy", seq, propagator=max_propagator, force=timed_out, literals=encoding.decode(literals))
+        if timed_out:
             raise TimeoutError(f"'construct_greedy' timed out after {time() - start_time} seconds")
 
         # find next smallest step
-        cons, new_literals = smallest_next_step(list(literals), 
-                                                constraints, 
-                                                max_propagator, 
-                                                time_limit=time_limit - (time() - start_time))
+        try:
+            with timed(stats, "greedy.step"):
+                cons, new_literals = _smallest_next_step(literals,
+                                                         constraints,
+                                                         max_propagator,
+                                                         time_limit=time_limit - (time() - start_time),
+                                                         fixpoint=fixpoint,
+                                                         graph=graph,
+                                                         pool=pool,
+                                                         scheduler=scheduler)
+        except TimeoutError:
+            # timed out while searching the step, the sequence up to it can still be resumed from
+            if checkpoint is not None:
+                checkpoint.save("greedy", seq, propagator=max_propagator, force=True, literals=encoding.decode(literals))
+            raise
+        if stats is not None:
+            stats.count("greedy.steps")
 
         # construct new step        
         new_step = dict(type="step", 
-                        input=frozenset(literals), 
+                        input=encoding.decode(literals), 
                         constraints=frozenset(cons), 
-                        output=frozenset(set(new_literals) - literals))
-        
-        literals = set(new_literals)
+                        output=encoding.decode(new_literals & ~literals))
+
+        # propagation is monotone, so only subsets touching a variable with a reduced domain can propagate again
+        fixpoint.invalidate(encoding.variables(new_literals & ~literals))
+        if scheduler is not None:
+            scheduler.update(cons, new_literals & ~literals)
+
+        literals = new_literals
 
         seq.append(new_step)
-        if set(goal_literals) <= set(literals): # found a sequence that explains the goal
+        yield dict(event="step", stage="greedy", step=new_step)
+        if goal_literals & ~literals == 0: # found a sequence that explains the goal
             break
 
-    return seq
\ No newline at end of file
+    return seq
@@ -1,145 +1,413 @@
+from time import time, perf_counter
+
 import cpmpy as cp
 from cpmpy.expressions.utils import is_any_list, flatlist
-from cpmpy.expressions.core import Comparison, Expression, BoolVal
-from cpmpy.expressions.variables import _NumVarImpl
 from cpmpy.tools.explain.utils import make_assump_model
 from cpmpy.solvers.solver_interface import ExitStatus
 from cpmpy.transformations.normalize import toplevel_list
+from cpmpy.transformations.cse import CSEMap
+from ortools.sat.python import cp_model
 
 from .utils import get_variables
-
-def filter_lits_to_vars(literals, vars):
-    vars = frozenset(vars)
-    
-    cons_lits= set()
-    for lit in literals:
-        if set(get_variables(lit)) & vars:
-            cons_lits.add(lit)
-
-    return list(cons_lits)
-
-
-def allowed_domain(literals, vars):
-    domainset = {var : set(range(var.lb, var.ub+1)) for var in vars}
-    for lit in literals:
-        if isinstance(lit, BoolVal) and lit.value() is False:
-            return {var : set() for var in vars}
-        assert isinstance(lit, Comparison)
-        assert lit.name == "!="
-        lhs, rhs = lit.args
-        assert isinstance(lhs, _NumVarImpl)
-        assert isinstance(rhs, int)
-        if lhs in domainset:
-            domainset[lhs].remove(rhs)
-
-    return domainset
+from .datastructures import LiteralEncoding, UNSAT_BIT
+from .cache import PropagationCache, PersistentCache, SolutionPool
 
 
 class Propagator:
+    """
+        Base class of all propagators.
+        Literals are encoded as bitsets internally, see LiteralEncoding.
+        `propagate` works on CPMpy literals, `propagate_bits` on bitsets of the encoding of the propagator.
+    """
+    solver_name = None # name of the CPMpy solver used to propagate, if any
 
-    def __init__(self, constraints: list, caching=True):
-        # bi-level cache with level 1 = constraint(s), level 2 = domains,
-        self.cache = dict() if caching else None
+    def __init__(self, constraints: list, caching=True, encoding=None, persistent_cache=None, solution_pool=True, stats=None):
+        # cache from constraint(s) and projected input literals to propagated literals
+        # caching can be True (unbounded cache), False or a PropagationCache with a bounded size
+        if isinstance(caching, PropagationCache):
+            self.cache = caching
+        else:
+            self.cache = PropagationCache() if caching else None
+        # optional on-disk cache shared across runs, probed when the in-memory cache misses
+        if isinstance(persistent_cache, str):
+            persistent_cache = PersistentCache(persistent_cache)
+        self.persistent_cache = persistent_cache
+        # solutions found by propagators that enumerate solutions, certify support of values in later calls
+        # solution_pool can be True, False or a SolutionPool shared with other propagators
+        if isinstance(solution_pool, SolutionPool):
+            self.solution_pool = solution_pool
+        else:
+            self.solution_pool = SolutionPool() if solution_pool else None
+        assert is_any_list(constraints), f"expected list but got {type(constraints)}"
         self.vars = set(get_variables(constraints))
+        # propagators can share an encoding, so their bitsets can be combined
+        self.encoding = LiteralEncoding(get_variables(constraints)) if encoding is None else encoding
         self.scope_cache = dict()
-        assert is_any_list(constraints), f"expected list but got {type(constraints)}"
         for cons in constraints:
             self.scope_cache[cons] = frozenset(get_variables(cons))
+        self.mask_cache = dict() # constraint -> bitset of all literals over its scope
+        self.stats = stats # optional Stats, counting calls, cache hits, subset sizes and time spent in the solver
+
+    def _scope(self, constraints):
+        scope = set()
+        for cons in constraints:
+            if cons not in self.scope_cache:
+                self.scope_cache[cons] = frozenset(get_variables(cons))
+            scope |= self.scope_cache[cons]
+        return scope
+
+    def _scope_mask(self, constraints):
+        mask = 0
+        for cons in constraints:
+            if cons not in self.mask_cache:
+                self.mask_cache[cons] = self.encoding.scope_mask(self._scope([cons]))
+            mask |= self.mask_cache[cons]
+        return mask
 
     def _probe_cache(self, literals, constraints):
         if self.cache is None: return None
+        return self.cache.get(frozenset(constraints), literals)
 
-        assert isinstance(literals, list)
-
-        if isinstance(constraints, Expression):
-            constraints = [constraints]
-        cons_vars = frozenset(get_variables(constraints))
-        assert isinstance(constraints, list)
+    def _fill_cache(self, literals, constraints, new_lits, cost=0):
+        if self.cache is None: return None
+        self.cache.put(frozenset(constraints), literals, new_lits, cost=cost)
+        return new_lits
 
-        constraints = frozenset(constraints)
-        if constraints not in self.cache:
+    def _persistent_key(self, literals, constraints):
+        # fingerprints do not depend on the encoding, so they can be shared across runs
+        # variables in the scope are part of the key with their bounds, as equal strings may refer to variables with other domains
+        scope = self._scope(constraints) if len(constraints) else self.encoding.variables(literals)
+        return (PersistentCache.fingerprint([str(cons) for cons in constraints] + [f"{var.name} in {var.lb}..{var.ub}" for var in scope]),
+                PersistentCache.fingerprint(str(lit) for lit in self.encoding.decode(literals)))
+
+    def _probe_persistent_cache(self, literals, constraints):
+        if self.persistent_cache is None: return None
+        result = self.persistent_cache.get(*self._persistent_key(literals, constraints))
+        if result is False:
             return None
+        elif result is None:
+            return UNSAT_BIT
+        var_names = {var.name: var for var in self.encoding.vars}
+        return self.encoding.encode(var_names[name] != val for name, val in result)
+
+    def _fill_persistent_cache(self, literals, constraints, new_lits):
+        if self.persistent_cache is None: return None
+        if new_lits == UNSAT_BIT:
+            result = None
+        else:
+            result = [(lit.args[0].name, int(lit.args[1])) for lit in self.encoding.decode(new_lits)]
+        self.persistent_cache.put(*self._persistent_key(literals, constraints), result)
 
-        cons_lits = filter_lits_to_vars(literals, cons_vars)
-
-        # convert to frozenset for hashing
-        cons_lits = frozenset(cons_lits)
-        return self.cache[constraints].get(cons_lits)
-
+    def _supported(self, literals, constraints):
+        # values in the scope of the constraints supported by stored solutions, as bitset of literals
+        if self.solution_pool is None: return 0
+        return self.solution_pool.supported(constraints, literals) & self._scope_mask(constraints)
 
-    def _fill_cache(self, literals, constraints, new_lits):
-        if self.cache is None: return None
+    def _assignment(self, cons_vars):
+        # current values of the variables, as bitset of literals
+        assignment = 0
+        for var in cons_vars:
+            assignment |= self.encoding.exclude(var, [var.value()])
+        return assignment
 
-        assert isinstance(constraints, list)
+    def _record(self, constraints, assignment):
+        # store an assignment satisfying the constraints
+        if self.solution_pool is not None:
+            self.solution_pool.add(constraints, assignment)
 
-        if isinstance(constraints, Expression):
-            constraints = [constraints]
+    def cache_stats(self):
+        """
+            Returns the hits, misses, evictions and size of the cache, or None if caching is disabled.
+            Hits and misses of the persistent cache are prefixed with "persistent_".
+        """
+        if self.cache is None and self.persistent_cache is None: return None
+        stats = self.cache.stats() if self.cache is not None else dict()
+        if self.persistent_cache is not None:
+            stats.update({f"persistent_{key}": val for key, val in self.persistent_cache.stats().items()})
+        return stats
 
-        cons_vars = frozenset(get_variables(constraints))
+    def propagate(self, literals, constraints, time_limit=3600, **kwargs):
+        """
+            Find all literals that are implied by the constraints an input literals.
+            Also returns input literals, as they are trivially implied.
+        """
+        new_bits = self.propagate_bits(self.encoding.encode(literals), constraints, time_limit=time_limit, **kwargs)
+        return self.encoding.decode(new_bits)
 
-        constraints = frozenset(constraints)
-        cons_lits = frozenset(filter_lits_to_vars(literals, cons_vars))
-        new_lits = frozenset(filter_lits_to_vars(new_lits, cons_vars))
+    def propagate_bits(self, literals, constraints, time_limit=3600, **kwargs):
+        """
+            Same as `propagate`, but literals are given and returned as bitset.
+            Returns UNSAT_BIT if the constraints are inconsistent with the literals.
+        """
+        if literals & UNSAT_BIT:
+            return UNSAT_BIT # nothing left to propagate
+        call_time = perf_counter()
+        constraints = toplevel_list(flatlist([constraints]), merge_and=False)
+        cons_lits, mask = self._project(literals, constraints)
+
+        new_lits = self._lookup(cons_lits, constraints)
+        hit = new_lits is not None
+        if new_lits is None:
+            start_time = time()
+            new_lits = self._propagate(cons_lits, constraints, time_limit=time_limit, **kwargs)
+            new_lits = self._store(cons_lits, constraints, mask, new_lits, cost=time() - start_time)
+        self._count_call(constraints, hit, call_time)
+
+        if new_lits == UNSAT_BIT:
+            return UNSAT_BIT
+        return new_lits | literals # also input counts
+
+    def propagate_many(self, literals, constraint_subsets, time_limit=3600, **kwargs):
+        """
+            Propagate each subset of constraints given the same input literals.
+            Returns a list with the propagated literals of each subset.
+        """
+        literals = self.encoding.encode(literals)
+        return [self.encoding.decode(new_lits) for new_lits in
+                self.iter_propagate_bits(literals, constraint_subsets, time_limit=time_limit, **kwargs)]
 
-        if constraints not in self.cache:
-            self.cache[constraints] = dict()
+    def iter_propagate_bits(self, literals, constraint_subsets, time_limit=3600, **kwargs):
+        """
+            Same as `propagate_many`, but literals are given as bitset and results are yielded lazily, in order.
+        """
+        start_time = time()
+        for constraints in constraint_subsets:
+            yield self.propagate_bits(literals, constraints, time_limit=time_limit - (time() - start_time), **kwargs)
+
+    def _count_call(self, constraints, hit, call_time):
+        # instrumentation of a propagation call that started at `call_time`, hit is whether it was answered from a cache
+        if self.stats is None: return
+        self.stats.count("propagate.calls")
+        self.stats.count("propagate.cache_hits" if hit else "propagate.cache_misses")
+        self.stats.observe("propagate.subset_size", len(constraints))
+        self.stats.add_time("propagate", call_time)
+
+    def _solver_time(self, start):
+        # instrumentation of a call to the solver that started at `start`
+        if self.stats is not None:
+            self.stats.add_time("propagate.solver", start)
+
+    def _project(self, literals, constraints):
+        # returns the literals over the scope of the constraints, and the bitset of that scope
+        if len(constraints) == 0:
+            mask = literals # only propagate domains of the literals themselves
+        else:
+            mask = self._scope_mask(constraints)
+        return literals & mask, mask
+
+    def _lookup(self, literals, constraints):
+        # check in-memory cache, then persistent cache
+        new_lits = self._probe_cache(literals, constraints)
+        if new_lits is None:
+            new_lits = self._probe_persistent_cache(literals, constraints)
+            if new_lits is not None:
+                self._fill_cache(literals, constraints, new_lits)
+        return new_lits
 
-        self.cache[constraints][cons_lits] = new_lits
+    def _store(self, literals, constraints, mask, new_lits, cost=0):
+        # store projected new domains in caches
+        if new_lits != UNSAT_BIT:
+            new_lits &= mask
+        self._fill_cache(literals, constraints, new_lits, cost=cost)
+        self._fill_persistent_cache(literals, constraints, new_lits)
         return new_lits
 
-    def propagate(self, domains, constraints, time_limit):
+    def _propagate(self, literals, constraints, time_limit, **kwargs):
+        """
+            Propagate the constraints given the bitset of literals over their scope.
+            Returns the bitset of implied literals over the scope of the constraints, or UNSAT_BIT.
+        """
         raise NotImplementedError(f"Propagation for propagator {type(self)} not implemented")
 
 
-class MaximalPropagate(Propagator):
-    """ Naive implementation of maximal propagation.
-        Enumerates solutions ensuring at least variable has an unseen variable
+class ORToolsPropagator(Propagator):
     """
-
-    def propagate(self, literals, constraints, solver="ortools",time_limit=3600):
+        Base class of stateful propagators using OR-Tools.
+        Every constraint is transformed and posted to OR-Tools only once, the resulting OR-Tools constraints
+            are kept aside in a library. For each call, only those of the propagated constraints are copied into the model,
+            and input literals are set by restricting the domains in the model. The model is emptied again afterwards.
+    """
+    solver_name = "ortools"
+
+    def __init__(self, constraints, caching=True, encoding=None, persistent_cache=None, solution_pool=True, stats=None):
+        super().__init__(constraints, caching, encoding, persistent_cache, solution_pool, stats)
+        self.constraints = toplevel_list(constraints, merge_and=False)
+        self.solver = None # built on first use
+
+    def _init_solver(self):
+        self.solver = cp.SolverLookup.get("ortools")
+        self.library = cp_model.CpModel().Proto() # all OR-Tools constraints ever posted
+        self.cons_protos = dict() # constraint -> indices of its OR-Tools constraints in the library
+        for cons in self.constraints:
+            self._post(cons)
+
+    @staticmethod
+    def _remap_intervals(ort_cons, remap):
+        # scheduling constraints refer to their interval constraints by index, which changes when moving constraints
+        if ort_cons.has_cumulative():
+            fields = [ort_cons.cumulative.intervals]
+        elif ort_cons.has_no_overlap():
+            fields = [ort_cons.no_overlap.intervals]
+        elif ort_cons.has_no_overlap_2d():
+            fields = [ort_cons.no_overlap_2d.x_intervals, ort_cons.no_overlap_2d.y_intervals]
+        else:
+            return
+        for field in fields:
+            idxes = [remap(i) for i in field]
+            field.clear()
+            field.extend(idxes)
+
+    def _move_to_library(self):
+        # move the constraints posted to the model into the library, returns their indices in the library
+        proto = self.solver.ort_model.Proto()
+        offset = len(self.library.constraints)
+        idxes = list(range(offset, offset + len(proto.constraints)))
+        for ort_cons in proto.constraints:
+            lib_cons = self.library.constraints.add()
+            lib_cons.copy_from(ort_cons)
+            self._remap_intervals(lib_cons, lambda i: i + offset)
+        proto.constraints.clear()
+        return idxes
+
+    def _post(self, cons):
+        if cons not in self.cons_protos:
+            # auxiliary variables should not be shared between constraints, as they are switched on independently
+            self.solver._csemap = CSEMap()
+            self.solver += cons
+            self.cons_protos[cons] = self._move_to_library()
+        return self.cons_protos[cons]
+
+    def _set_domain(self, var, values):
+        # restrict the domain of the variable in the OR-Tools model to the given (sorted) values
+        intervals = []
+        for val in values:
+            if len(intervals) and intervals[-1] == val - 1:
+                intervals[-1] = val
+            else:
+                intervals += [val, val]
+        proto = self.solver.ort_model.Proto().variables[self.solver.solver_var(var).Index()]
+        proto.domain.clear()
+        proto.domain.extend(intervals)
+
+    def _switch_on(self, idxes):
+        constraints = self.solver.ort_model.Proto().constraints
+        # the OR-Tools constraints of a constraint are consecutive in the library and switched on together
+        idxes = list(idxes)
+        offset = len(constraints) - idxes[0] if len(idxes) else 0
+        for i in idxes:
+            ort_cons = constraints.add()
+            ort_cons.copy_from(self.library.constraints[i])
+            self._remap_intervals(ort_cons, lambda i: i + offset)
+
+    def _load(self, literals, constraints):
         """
-            Find all literals that are implied by the constraints an input literals.
-            Also returns input literals, as they are trivially implied.
+            Switch on the constraints and restrict the domains to the literals.
+            Returns the variables with a restricted domain, or None if a domain is empty.
         """
+        if self.solver is None:
+            self._init_solver()
 
-        literals = list(literals)
-        constraints = flatlist([constraints])
-        constraints = toplevel_list(constraints, merge_and=False)
-
-        # check cache
-        cached = self._probe_cache(literals, constraints)
-        if cached is not None: return cached | literals # re-add input literals
+        restricted = self.encoding.variables(literals)
+        var_masks = [self.encoding.masks[self.encoding.index(var)] for var in restricted]
+        if any(literals & mask == mask for mask in var_masks):
+            return None # empty domain, conflict
 
-        solver = cp.SolverLookup.get(solver)
-        solver += list(literals) + list(constraints)
-        cons_vars = set(get_variables(constraints))
+        for cons in constraints:
+            self._switch_on(self._post(cons))
+        for var in restricted:
+            self._set_domain(var, self.encoding.domain(literals, var))
+        return restricted
 
-        values_seen = {var : set() for var in cons_vars}
-        while solver.solve(time_limit=time_limit) is True:
-            time_limit = time_limit - solver.status().runtime
-            if time_limit <= 0:
-                raise TimeoutError("Time limit reached during maximal propagation")
+    def _unload(self, restricted):
+        # restore the empty model
+        self.solver.ort_model.Proto().constraints.clear()
+        for var in restricted:
+            self._set_domain(var, range(var.lb, var.ub + 1))
 
-            for var in cons_vars:
-                values_seen[var].add(var.value())
-            
-            # find at least one new value for a variable
-            clause = []
-            for var in cons_vars:
-                clause += [var == val for val in set(range(var.lb, var.ub+1)) - values_seen[var]]
-            solver += cp.any(clause)
 
-        if any(len(values_seen[var]) == 0 for var in cons_vars):
-            return {BoolVal(False)}
+class MaximalPropagate(ORToolsPropagator):
+    """ Naive implementation of maximal propagation.
+        Enumerates solutions ensuring at least variable has an unseen variable
+        Stateful, see ORToolsPropagator.
+    """
 
-        new_lits = []
-        for var in cons_vars:
-            new_lits += [var != val for val in set(range(var.lb, var.ub+1)) - values_seen[var]]
+    def _init_solver(self):
+        self.eq_lits = dict() # variable -> value -> OR-Tools Boolean variable equivalent to `var == val`
+        self.eq_protos = dict() # variable -> indices of the OR-Tools constraints defining its eq_lits
+        super()._init_solver()
+
+    def _eq_lits(self, var):
+        # Boolean variables equivalent to `var == val` for every value, defined by constraints in the library
+        if var not in self.eq_lits:
+            self.eq_lits[var], self.eq_protos[var] = dict(), []
+            ort_var = self.solver.solver_var(var).Index()
+            for val in range(var.lb, var.ub + 1):
+                lit = self.solver.ort_model.NewBoolVar(f"{var}=={val}").Index()
+                other_values = [bound for lb, ub in [(var.lb, val - 1), (val + 1, var.ub)] if lb <= ub for bound in (lb, ub)]
+                for enforce, domain in [(lit, [val, val]), (-lit - 1, other_values)]:
+                    self.eq_protos[var].append(len(self.library.constraints))
+                    ort_cons = self.library.constraints.add()
+                    ort_cons.enforcement_literal.append(enforce)
+                    ort_cons.linear.vars.append(ort_var)
+                    ort_cons.linear.coeffs.append(1)
+                    ort_cons.linear.domain.extend(domain)
+                self.eq_lits[var][val] = lit
+        return self.eq_lits[var]
+
+    def _propagate(self, literals, constraints, time_limit=3600, solver="ortools"):
+        """
+            Find all literals that are implied by the constraints an input literals.
+        """
+        assert solver == "ortools", f"MaximalPropagate requires the ortools solver, but got {solver}"
+        restricted = self._load(literals, constraints)
+        if restricted is None:
+            return UNSAT_BIT
+        try:
+            return self._enumerate(literals, constraints, self._scope(constraints), time_limit)
+        finally:
+            self._unload(restricted)
+
+    def _enumerate(self, literals, constraints, cons_vars, time_limit):
+        # values supported by solutions found before do not need to be found again
+        seen = self._supported(literals, constraints)
+        found = seen != 0 # any solution is known
+        blocking = None
+        while 1:
+            if found:
+                # find at least one new value for a variable
+                clause = []
+                for var in cons_vars:
+                    eq_lits = self._eq_lits(var)
+                    clause += [eq_lits[val] for val in self.encoding.domain(seen, var)]
+                if len(clause) == 0:
+                    break # all values seen, no need to call the solver again
+
+                if blocking is None:
+                    self._switch_on(i for var in cons_vars for i in self.eq_protos[var])
+                    blocking = self.solver.ort_model.Proto().constraints.add().bool_or
+                # each clause implies the previous one, so it replaces the previous one
+                blocking.literals.clear()
+                blocking.literals.extend(clause)
+
+            solve_time = perf_counter()
+            found_solution = self.solver.solve(time_limit=time_limit)
+            self._solver_time(solve_time)
+            if found_solution is not True:
+                if self.solver.status().exitstatus == ExitStatus.UNKNOWN:
+                    raise TimeoutError("Time limit reached during maximal propagation")
+                break
+            time_limit = time_limit - self.solver.status().runtime
+            if time_limit <= 0:
+                raise TimeoutError("Time limit reached during maximal propagation")
 
-        self._fill_cache(literals, constraints, new_lits)
-        new_lits = frozenset(new_lits) | frozenset(literals) # also input counts
+            assignment = self._assignment(cons_vars)
+            self._record(constraints, assignment)
+            seen |= assignment
+            found = True
 
-        return new_lits
+        if not found:
+            return UNSAT_BIT
+        return self._scope_mask(constraints) & ~seen # values that are not seen are not supported
 
 
 class MaximalPropagateSolveAll(Propagator):
@@ -147,50 +415,45 @@ class MaximalPropagateSolveAll(Propagator):
         Enumerates all solutions of the constraints, and post-processes them to find all possible values for each variable
         Can be more efficient than MaximalPropagate if solutions are sparse.
     """
+    solver_name = "ortools"
 
-    def propagate(self, literals, constraints, solver="ortools", time_limit=3600):
+    def _propagate(self, literals, constraints, time_limit=3600, solver="ortools"):
         """
             Find all literals that are implied by the constraints an input literals.
-            Also returns input literals, as they are trivially implied.
         """
-
-        literals = list(literals)
-        constraints = flatlist([constraints])
-        constraints = toplevel_list(list(constraints), merge_and=False)
-
-        # check cache
-        cached = self._probe_cache(literals, constraints)
-        if cached is not None: return cached
-
         # only care about variables in constraints
-        cons_vars = set(get_variables(constraints))
+        cons_vars = self._scope(constraints)
+        mask = self._scope_mask(constraints)
+
+        # values supported by solutions found before do not need to be found again
+        seen = self._supported(literals, constraints)
+        unseen = [var == val for var in cons_vars for val in self.encoding.domain(seen, var)]
+        if seen != 0 and len(unseen) == 0:
+            return 0 # all values are supported
 
         solver = cp.SolverLookup.get(solver)
-        solver += filter_lits_to_vars(literals, cons_vars)
+        solver += list(self.encoding.decode(literals))
         solver += constraints
+        if seen != 0:
+            solver += cp.any(unseen) # only enumerate solutions with a new value
 
-        visited = {var: set() for var in cons_vars}
         def callback():
-            for var in cons_vars:
-                visited[var].add(var.value())
+            nonlocal seen
+            assignment = self._assignment(cons_vars)
+            if assignment & ~seen: # only keep solutions with a new value
+                self._record(constraints, assignment)
+                seen |= assignment
+        solve_time = perf_counter()
         num_sols = solver.solveAll(display=callback, time_limit=time_limit)
+        self._solver_time(solve_time)
 
         if solver.status().runtime >= time_limit:
             raise TimeoutError
 
-        if num_sols == 0:
+        if num_sols == 0 and seen == 0:
             assert solver.status().exitstatus == ExitStatus.UNSATISFIABLE
-            return {cp.BoolVal(False)}
-
-        new_lits = []
-        for var, dom in visited.items():
-            new_lits += [var != val for val in set(range(var.lb, var.ub+1)) - dom]
-
-        # store new domains in cache
-        self._fill_cache(literals, constraints, new_lits)
-        new_lits = frozenset(new_lits) | frozenset(literals) # also input counts
-
-        return new_lits
+            return UNSAT_BIT
+        return mask & ~seen # values that are not seen are not supported
 
 
 class ExactPropagate(Propagator):
@@ -198,9 +461,10 @@ class ExactPropagate(Propagator):
         Uses Exacts' builtin domain pruning method.
         Stateful, so can be used repeatedly without re-initializing the solver.
     """
+    solver_name = "exact"
 
-    def __init__(self, constraints, caching=True):
-        super().__init__(constraints, caching)
+    def __init__(self, constraints, caching=True, encoding=None, persistent_cache=None, stats=None):
+        super().__init__(constraints, caching, encoding, persistent_cache, stats=stats)
 
         # initialize solver and do all necesessary things in background
         model, soft, assump = make_assump_model(soft=constraints)
@@ -210,69 +474,110 @@ class ExactPropagate(Propagator):
         self.solver += model.constraints
         assert self.solver.solve()
 
-    def propagate(self, literals, constraints, time_limit=3600):
+        self._domains = 0 # bitset of literals for which domain assumptions are currently set
+        self._indicators = [] # indicator variables of constraints currently assumed
+
+    def _propagate(self, literals, constraints, time_limit=3600):
         """
             Find all literals that are implied by the constraints an input literals.
-            Also returns input literals, as they are trivially implied.
         """
-
-        literals = list(literals)
-        constraints = flatlist([constraints])
-        constraints = toplevel_list(list(constraints), merge_and=False)
-        
-        # check cache
-        cached = self._probe_cache(literals, constraints)
-        if cached is not None: 
-            return list(frozenset(cached) | frozenset(literals)) # re-add input literals
-
-        self.solver.xct_solver.clearAssumptions()
         if len(constraints) == 0:
-            cons_vars = get_variables(literals)
+            cons_vars = self.encoding.variables(literals)
+            mask = self.encoding.scope_mask(cons_vars)
         else:
             cons_vars = get_variables(constraints)
-        domainset = allowed_domain(literals, cons_vars)
-
-        # set assumptions related to domains
-        assump_list = []
-        for var, values in dict(domainset).items():
-            if set(values) == set(range(var.lb,var.ub+1)):
-                continue # full domain, do not set assumptions
-            elif len(values) == 0: # empty domain, conflict
-                return {BoolVal(False)}
+            mask = self._scope_mask(constraints)
+
+        # set assumptions related to domains, only for variables in the scope.
+        # assumptions on other variables do not influence the pruned domains, so they are kept as is
+        if not self._set_domains((self._domains & ~mask) | literals):
+            return UNSAT_BIT # empty domain, conflict
+        return self._prune(constraints, cons_vars, time_limit)
+
+    def iter_propagate_bits(self, literals, constraint_subsets, time_limit=3600):
+        """
+            Same as `propagate_many`, but literals are given as bitset and results are yielded lazily, in order.
+            Domain assumptions are set once for all input literals, only the assumptions on the
+                indicator variables of the constraints are swapped for each subset.
+        """
+        start_time = time()
+        for constraints in constraint_subsets:
+            call_time = perf_counter()
+            constraints = toplevel_list(flatlist([constraints]), merge_and=False)
+            if literals & UNSAT_BIT or len(constraints) == 0:
+                yield self.propagate_bits(literals, constraints, time_limit=time_limit - (time() - start_time))
+                continue
+
+            cons_lits, mask = self._project(literals, constraints)
+            new_lits = self._lookup(cons_lits, constraints)
+            hit = new_lits is not None
+            if new_lits is None:
+                if not self._set_domains(literals):
+                    # some domain is empty, propagate this subset on its own
+                    yield self.propagate_bits(literals, constraints, time_limit=time_limit - (time() - start_time))
+                    continue
+                prop_time = time()
+                new_lits = self._prune(constraints, get_variables(constraints), time_limit - (prop_time - start_time))
+                new_lits = self._store(cons_lits, constraints, mask, new_lits, cost=time() - prop_time)
+            self._count_call(constraints, hit, call_time)
+
+            yield UNSAT_BIT if new_lits == UNSAT_BIT else new_lits | literals
+
+    def _set_domains(self, literals):
+        """
+            Update the domain assumptions to the given literals, returns False if any domain is empty.
+            Only the assumptions of variables whose literals changed since the previous call are replaced,
+                so growing the literals by one step only touches the variables of that step.
+        """
+        assump_list, cleared = [], []
+        for var in self.encoding.variables(self._domains ^ literals):
+            var_mask = self.encoding.masks[self.encoding.index(var)]
+            if literals & var_mask == 0:
+                cleared.append(self.solver.solver_var(var)) # full domain, remove assumptions
+            elif literals & var_mask == var_mask:
+                return False # empty domain, conflict
             else:
-                assump_list.append((self.solver.solver_var(var), list(values)))
+                assump_list.append((self.solver.solver_var(var), self.encoding.domain(literals, var)))
 
-        self.solver.xct_solver.setAssumptionsList(assump_list)
+        if len(cleared):
+            self.solver.xct_solver.clearAssumptions(cleared)
+        if len(assump_list):
+            self.solver.xct_solver.setAssumptionsList(assump_list) # replaces previous assumptions of the variables
+        self._domains = literals
+        return True
 
-        # set assumptions for constraints
+    def _prune(self, constraints, cons_vars, time_limit):
+        """
+            Set assumptions for the constraints, replacing those of the previous subset, and prune the domains
+        """
+        if len(self._indicators):
+            self.solver.xct_solver.clearAssumptions(self._indicators)
+        self._indicators = []
         if len(constraints) > 0:
-            assump = self.solver.solver_vars([self.cons_dict[c] for c in constraints])
-            self.solver.xct_solver.setAssumptions(list(zip(assump, [1]*len(constraints))))
+            self._indicators = self.solver.solver_vars([self.cons_dict[c] for c in constraints])
+            self.solver.xct_solver.setAssumptions(list(zip(self._indicators, [1]*len(constraints))))
 
+        solve_time = perf_counter()
         status, new_domains = self.solver.xct_solver.pruneDomains(vars=self.solver.solver_vars(cons_vars),
                                                                   timeout=time_limit)
+        self._solver_time(solve_time)
         
 
         if status == "TIMEOUT":
             raise TimeoutError
         elif status == "INCONSISTENT":
-            return {BoolVal(False)}
+            return UNSAT_BIT
         elif status == "SAT":
-            new_lits = []
+            new_lits = 0
             for var, dom in zip(cons_vars, new_domains):
-                new_lits += [var != val for val in set(range(var.lb, var.ub + 1)) - set(dom)]
-
-            # store new domains in cache
-            self._fill_cache(literals, constraints, new_lits)
-            new_lits = frozenset(new_lits) | frozenset(literals)  # also input counts
-
+                new_lits |= self.encoding.restrict(var, dom)
             return new_lits
 
         else:
             raise ValueError("Unexpected status", status)
 
 
-class CPPropagate(Propagator):
+class CPPropagate(ORToolsPropagator):
     """
         Propagatoar using OR-Tools' presolve function
         Does root-level propagation so (much) weaker than MaximalPropagate, but very fast.
@@ -300,40 +605,34 @@ class CPPropagate(Propagator):
         presolve_inclusion_work_limit = 0,
     )
 
-    def propagate(self, literals, constraints, time_limit, only_unit_propagation=True):
+    def _propagate(self, literals, constraints, time_limit=3600, only_unit_propagation=True):
         
-        literals = list(literals)
-        constraints = toplevel_list(constraints, merge_and=False)
-
-        # check cache       
-        cached = self._probe_cache(literals, constraints)
-        if cached is not None: 
-            return list(frozenset(cached) | frozenset(literals)) # re-add input literals
-
         # only care about domains of variables in constraints
-        cons_vars = set(get_variables(constraints))
-
-        solver = cp.SolverLookup.get("ortools")
-        solver += constraints
-        solver += literals
-
-        
-        if only_unit_propagation:
-            solver.solve(**self.req_kwargs, **self.prop_kwargs)
-        else:
-            solver.solve(**self.req_kwargs)
-
-        bounds = solver.ort_solver.ResponseProto().tightened_variables
+        cons_vars = self._scope(constraints)
+
+        restricted = self._load(literals, constraints)
+        if restricted is None:
+            return UNSAT_BIT
+        try:
+            solve_time = perf_counter()
+            if only_unit_propagation:
+                self.solver.solve(**self.req_kwargs, **self.prop_kwargs)
+            else:
+                self.solver.solve(**self.req_kwargs)
+            self._solver_time(solve_time)
+            bounds = self.solver.ort_solver.ResponseProto().tightened_variables
+        finally:
+            self._unload(restricted)
 
         if len(bounds) == 0:
             # UNSAT, no propagation possible
-            return frozenset({BoolVal(False)})
+            return UNSAT_BIT
     
         else:
             # convert bounded domains to != literals
-            new_lits = []
+            new_lits = 0
             for var in cons_vars:
-                ort_var = solver.solver_var(var)
+                ort_var = self.solver.solver_var(var)
                 var_bounds = bounds[ort_var.Index()].domain
 
                 lbs = [val for i, val in enumerate(var_bounds) if i % 2 == 0]
@@ -343,10 +642,5 @@ class CPPropagate(Propagator):
                 for lb, ub in zip(lbs, ubs):
                     prop_dom |= set(range(lb, ub + 1))
                 
-                new_lits += [var != val for val in set(range(var.lb, var.ub + 1)) - prop_dom]
-
-            # store new domains in cache
-            self._fill_cache(literals, constraints, new_lits)
-            new_lits = frozenset(new_lits) | frozenset(literals) # also input counts
-
-            return new_lits
\ No newline at end of file
+                new_lits |= self.encoding.restrict(var, prop_dom)
+            return new_lits
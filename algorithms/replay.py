@@ -0,0 +1,173 @@
+import os
+import gzip
+import json
+
+from .datastructures import UNSAT_BIT
+from .propagate import Propagator, ExactPropagate
+
+
+class PropagationTrace:
+    """
+        Results of propagation calls, keyed by the constraints and the input literals over their scope.
+        Like a Checkpoint, constraints are identified by their string representation and variables by their name,
+            so a trace recorded in one process can be replayed in another one, with the constraints of a freshly built model.
+        Literals are stored as bitsets over the variables of the trace, each variable gets a block of bits in order of first use.
+        Written as gzipped JSON with a table of constraints, a table of variables and the calls,
+            bitsets are written as hexadecimal strings and UNSAT as null.
+    """
+
+    def __init__(self):
+        self.constraints = [] # index -> string of constraint
+        self.cons_idx = dict() # string of constraint -> index
+        self.variables = [] # index -> (name, lb, ub)
+        self.var_offset = dict() # name -> position of first bit
+        self.n_bits = 0
+        self.calls = dict() # (sorted indices of constraints, input bits) -> output bits, or None if UNSAT
+
+        self._cons_keys = dict() # constraint -> index, avoids converting constraints to strings on every call
+
+    def __len__(self):
+        return len(self.calls)
+
+    def _cons_key(self, constraints, add=False):
+        key = []
+        for cons in constraints:
+            idx = self._cons_keys.get(cons)
+            if idx is None:
+                idx = self.cons_idx.get(str(cons))
+                if idx is None:
+                    if not add:
+                        return None
+                    idx = self.cons_idx[str(cons)] = len(self.constraints)
+                    self.constraints.append(str(cons))
+                self._cons_keys[cons] = idx
+            key.append(idx)
+        return tuple(sorted(key))
+
+    def _offset(self, var, add=False):
+        offset = self.var_offset.get(var.name)
+        if offset is None:
+            if not add:
+                return None
+            offset = self.var_offset[var.name] = self.n_bits
+            self.variables.append((var.name, int(var.lb), int(var.ub)))
+            self.n_bits += var.ub - var.lb + 1
+        return offset
+
+    def _to_trace(self, bits, encoding, add=False):
+        # move the block of bits of each variable from its position in the encoding to its position in the trace
+        trace_bits = 0
+        for var in encoding.variables(bits):
+            idx = encoding.index(var)
+            offset = self._offset(var, add)
+            if offset is None:
+                return None
+            trace_bits |= ((bits & encoding.masks[idx]) >> encoding.offsets[idx]) << offset
+        return trace_bits
+
+    def _from_trace(self, trace_bits, encoding, scope):
+        # inverse of `_to_trace`, for the variables in the scope of the call
+        # variables without any literal in the trace were never added to it, they have no bits to move
+        bits = 0
+        for var in scope:
+            offset = self.var_offset.get(var.name)
+            if offset is None:
+                continue
+            idx = encoding.index(var)
+            block = (trace_bits >> offset) & (encoding.masks[idx] >> encoding.offsets[idx])
+            bits |= block << encoding.offsets[idx]
+        return bits
+
+    def add(self, constraints, literals, new_lits, encoding):
+        """
+            Record the result of propagating the constraints, literals are given as bitsets of the encoding
+        """
+        key = (self._cons_key(constraints, add=True), self._to_trace(literals, encoding, add=True))
+        if new_lits == UNSAT_BIT:
+            self.calls[key] = None
+        else:
+            self.calls[key] = self._to_trace(new_lits, encoding, add=True)
+
+    def get(self, constraints, literals, encoding, scope):
+        """
+            Returns the recorded result of propagating the constraints as bitset of the encoding,
+                restricted to the variables in the scope of the call. Raises a KeyError if the call was not recorded.
+        """
+        cons_key = self._cons_key(constraints)
+        trace_lits = self._to_trace(literals, encoding)
+        key = (cons_key, trace_lits)
+        if cons_key is None or trace_lits is None or key not in self.calls:
+            raise KeyError(f"Propagation of {constraints} with literals {encoding.decode(literals)} is not in the trace")
+        new_lits = self.calls[key]
+        if new_lits is None:
+            return UNSAT_BIT
+        return self._from_trace(new_lits, encoding, scope)
+
+    def save(self, path):
+        data = dict(constraints=self.constraints,
+                    variables=self.variables,
+                    calls=[(list(cons), hex(lits), None if new_lits is None else hex(new_lits))
+                           for (cons, lits), new_lits in self.calls.items()])
+        # write to a temporary file first, so an interruption while writing does not corrupt the trace
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt") as f:
+            data = json.load(f)
+        trace = cls()
+        trace.constraints = data['constraints']
+        trace.cons_idx = {cons: idx for idx, cons in enumerate(trace.constraints)}
+        for name, lb, ub in data['variables']:
+            trace.variables.append((name, lb, ub))
+            trace.var_offset[name] = trace.n_bits
+            trace.n_bits += ub - lb + 1
+        trace.calls = {(tuple(cons), int(lits, 16)): None if new_lits is None else int(new_lits, 16)
+                       for cons, lits, new_lits in data['calls']}
+        return trace
+
+
+class RecordingPropagator(Propagator):
+    """
+        Propagates with a propagator of class `propagator_class`, and records every call that reaches it in a PropagationTrace.
+        Calls answered by the in-memory cache were recorded when they were first propagated, so the trace holds
+            every distinct call. The persistent cache is not used, so every distinct call is recorded.
+        Can be given to the algorithms as propagator class with `functools.partial`, e.g.
+            `construct_greedy(..., PROP=partial(RecordingPropagator, trace=trace))`, and written with `trace.save(path)`.
+        Propagators in worker processes of a PropagatorPool do not record to the trace of this process.
+    """
+
+    def __init__(self, constraints, caching=True, encoding=None, persistent_cache=None, stats=None, trace=None,
+                 propagator_class=ExactPropagate):
+        super().__init__(constraints, caching, encoding, stats=stats)
+        self.trace = trace if trace is not None else PropagationTrace()
+        self.propagator = propagator_class(constraints, caching=False, encoding=self.encoding, stats=stats)
+
+    def _propagate(self, literals, constraints, time_limit=3600, **kwargs):
+        new_lits = self.propagator._propagate(literals, constraints, time_limit=time_limit, **kwargs)
+        self.trace.add(constraints, literals, new_lits, self.encoding)
+        return new_lits
+
+
+class ReplayPropagator(Propagator):
+    """
+        Answers propagation calls from a PropagationTrace, without calling any solver.
+        Raises a KeyError on calls that are not in the trace.
+        Constraints should be those of the model the trace was recorded on, variables should have the same bounds.
+        Greedy construction and filtering replay without a solver: as the propagator has no `solver_name`,
+            filtering uses neither the conflict checker nor the CP pre-check, unless asked for explicitly.
+            Relaxing the sequence does not propagate, it always needs Exact.
+        :param trace: a PropagationTrace or the path to a saved one
+    """
+
+    def __init__(self, constraints, caching=True, encoding=None, persistent_cache=None, stats=None, trace=None):
+        super().__init__(constraints, caching, encoding, persistent_cache, stats=stats)
+        assert trace is not None, "ReplayPropagator requires a trace"
+        self.trace = PropagationTrace.load(trace) if isinstance(trace, str) else trace
+
+    def _propagate(self, literals, constraints, time_limit=3600, **kwargs):
+        scope = self.encoding.variables(literals) if len(constraints) == 0 else self._scope(constraints)
+        return self.trace.get(constraints, literals, self.encoding, scope)
@@ -0,0 +1,83 @@
+import heapq
+
+from .datastructures import iter_bits, UNSAT_BIT
+
+
+class CandidateScheduler:
+    """
+        Decides in which order candidate subsets of constraints are propagated during greedy construction.
+        Candidates are given as tuples of constraint indices in the ConstraintGraph, literals as bitset.
+        The base scheduler keeps the order of enumeration.
+    """
+
+    def __init__(self, graph, encoding):
+        self.graph = graph
+        self.encoding = encoding
+
+    def order(self, candidates, literals):
+        """
+            Returns the candidates in the order they should be propagated, as an iterable
+        """
+        return candidates
+
+    def update(self, constraints, new_literals):
+        """
+            Called when a step is added to the sequence, with its constraints and the bitset of literals it derived
+        """
+        pass
+
+
+class SuccessPriorScheduler(CandidateScheduler):
+    """
+        Tries the candidates that are most likely to propagate something first, ranked by
+            - how recently the domain of a variable in their scope shrank,
+            - how often their constraints propagated something before,
+            - the fraction of variables in their scope with a reduced domain.
+        Ties are broken by the order of enumeration, so the order is deterministic.
+        Candidates are ranked within a sliding window of `window` candidates, so a size with many connected subsets
+            is not enumerated in full before the first one is propagated. The best candidate in the window is propagated
+            next and replaced by the next one enumerated, a larger window ranks more candidates at the cost of memory.
+    """
+
+    def __init__(self, graph, encoding, window=1000):
+        super().__init__(graph, encoding)
+        self.window = window
+        self.cons_idx = {cons: i for i, cons in enumerate(graph.constraints)}
+        self.scope_idxes = [[encoding.index(var) for var in scope] for scope in graph.scopes]
+        self.n_steps = 0
+        self.last_shrunk = dict() # variable index -> step in which its domain shrank last
+        self.n_propagated = [0] * len(graph) # constraint index -> number of steps it is part of
+
+    def order(self, candidates, literals):
+        reduced = {self.encoding.lit_var[i] for i in iter_bits(literals & ~UNSAT_BIT)}
+
+        def priority(idxes):
+            scope = set().union(*[self.scope_idxes[i] for i in idxes])
+            recency = max((self.last_shrunk.get(var, -1) for var in scope), default=-1)
+            n_propagated = sum(self.n_propagated[i] for i in idxes)
+            fraction_reduced = len(scope & reduced) / len(scope) if len(scope) else 0
+            return recency, n_propagated, fraction_reduced
+
+        if len(self.last_shrunk) == 0:
+            return candidates
+        return self._ranked(candidates, priority)
+
+    def _ranked(self, candidates, priority):
+        # min-heap on the negated priority, ties are broken by the position in the enumeration
+        heap = []
+        for position, idxes in enumerate(candidates):
+            recency, n_propagated, fraction_reduced = priority(idxes)
+            entry = (-recency, -n_propagated, -fraction_reduced, position, idxes)
+            if len(heap) < self.window:
+                heapq.heappush(heap, entry)
+            else:
+                yield heapq.heappushpop(heap, entry)[-1]
+        while len(heap):
+            yield heapq.heappop(heap)[-1]
+
+    def update(self, constraints, new_literals):
+        for var in self.encoding.variables(new_literals):
+            self.last_shrunk[self.encoding.index(var)] = self.n_steps
+        for cons in constraints:
+            self.n_propagated[self.cons_idx[cons]] += 1
+        self.n_steps += 1
@@ -0,0 +1,99 @@
+import os
+import json
+from time import perf_counter
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class Stats:
+    """
+        Counters, timers and histograms of the propagators and the stages of the pipeline.
+        Timers accumulate the wall-clock time of named sections, histograms count how often each value is observed.
+        The same Stats is shared by all propagators and stages of a run, e.g. `find_sequence(..., stats=Stats())`.
+        Propagators in worker processes of a PropagatorPool are not instrumented.
+        :param callback: optional function called as `callback(kind, name, value)` on every update,
+            where kind is "count", "observe" or "time" and value the increment, observed value or duration
+        :param trace: keep every timed section as a span, so the run can be exported as Chrome trace events
+    """
+
+    def __init__(self, callback=None, trace=False):
+        self.counters = Counter()
+        self.timers = defaultdict(float)
+        self.histograms = defaultdict(Counter)
+        self.callback = callback
+        self.spans = [] if trace else None # (name, start, duration)
+        self.origin = perf_counter()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+        if self.callback is not None:
+            self.callback("count", name, n)
+
+    def observe(self, name, value):
+        self.histograms[name][value] += 1
+        if self.callback is not None:
+            self.callback("observe", name, value)
+
+    def add_time(self, name, start):
+        """
+            Add the time since `start`, a value of `perf_counter`, to the timer
+        """
+        duration = perf_counter() - start
+        self.timers[name] += duration
+        if self.spans is not None:
+            self.spans.append((name, start, duration))
+        if self.callback is not None:
+            self.callback("time", name, duration)
+
+    @contextmanager
+    def timer(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, start)
+
+    def summary(self):
+        """
+            Returns the counters, timers and histograms as dict.
+            The time of propagation calls spent outside the solvers is reported as the "propagate.overhead" timer.
+        """
+        timers = dict(self.timers)
+        if "propagate" in timers:
+            timers["propagate.overhead"] = timers["propagate"] - timers.get("propagate.solver", 0)
+        return dict(counters=dict(self.counters), timers=timers,
+                    histograms={name: dict(sorted(hist.items())) for name, hist in self.histograms.items()})
+
+    def to_json(self, path=None):
+        """
+            Returns the summary as JSON string, and writes it to `path` if given
+        """
+        data = json.dumps(self.summary(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(data)
+        return data
+
+    def chrome_trace(self, path=None):
+        """
+            Returns the timed sections as Chrome trace events, to be opened in chrome://tracing or Perfetto,
+                and writes them to `path` if given. Requires `trace=True`.
+            The final values of the counters are added as a counter event at the end of the trace.
+        """
+        assert self.spans is not None, "Chrome traces require a Stats with trace=True"
+        pid = os.getpid()
+        events = [dict(name=name, cat=name.split(".")[0], ph="X", ts=(start - self.origin) * 1e6, dur=duration * 1e6, pid=pid, tid=0)
+                  for name, start, duration in self.spans]
+        events.append(dict(name="counters", ph="C", ts=(perf_counter() - self.origin) * 1e6, pid=pid, tid=0, args=dict(self.counters)))
+        trace = dict(traceEvents=events, displayTimeUnit="ms")
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(trace, f)
+        return trace
+
+
+def timed(stats, name):
+    """
+        Context manager timing a section in `stats`, does nothing if stats is None
+    """
+    return stats.timer(name) if stats is not None else nullcontext()
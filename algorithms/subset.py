@@ -1,61 +1,141 @@
-from time import time
+from collections import deque
+
 import cpmpy as cp
 
+from .utils import get_variables
+
+
+class OCUSEngine:
+    """
+        Optimal constrained unsatisfiable subsets over a universe of soft constraints, shared by many calls.
+        The oracle, hitting set solver and grow solver are built once, a soft constraint is added behind an assumption variable
+            the first time a call uses it.
+        The hard constraints of a call are part of the universe as well, they are always in the hitting set of that call.
+        The last `max_solutions` satisfying assignments found by growing are kept, in a later call the soft constraints
+            one of them violates are a correction subset, if it satisfies the hard constraints of that call.
+        :param grow: strategy to grow a satisfiable subset, "maxsat" to a maximum satisfiable subset,
+            or "greedy" to the constraints satisfied by the solution of the oracle, which is cheaper but finds larger correction subsets
+    """
+
+    def __init__(self, hard=[], solver="ortools", hs_solver="ortools", grow="maxsat", max_solutions=1000):
+        assert grow in ("maxsat", "greedy"), f"Unknown grow strategy {grow}"
+        self.grow = grow
+        self.oracle = cp.SolverLookup.get(solver)
+        self.oracle += hard
+        self.hs_solver = cp.SolverLookup.get(hs_solver)
+        self.grow_solver = None
+        if grow == "maxsat":
+            self.grow_solver = cp.SolverLookup.get("ortools")
+            self.grow_solver += hard
+
+        self.soft = [] # index -> soft constraint
+        self.assump = [] # index -> assumption variable
+        self.scopes = [] # index -> variables of the soft constraint
+        self.index = dict() # soft constraint -> index
+        self.variables = set(get_variables(hard))
+        self.solutions = deque(maxlen=max_solutions) # (assignment, index -> whether the assignment satisfies the soft constraint)
+        self.n_calls = 0
+
+    def _add(self, soft):
+        # add soft constraints to the universe
+        new = []
+        for cons in soft:
+            if cons not in self.index:
+                self.index[cons] = len(self.soft)
+                self.soft.append(cons)
+                self.assump.append(cp.boolvar(name=f"assump[{self.index[cons]}]"))
+                self.scopes.append(get_variables(cons))
+                self.variables |= set(self.scopes[-1])
+                new.append(self.assump[-1].implies(cons))
+        if len(new):
+            self.oracle += new
+            if self.grow_solver is not None:
+                self.grow_solver += new
+
+    def _satisfied(self, solution, i):
+        # whether the stored assignment satisfies soft constraint i, soft constraints over unassigned variables are not satisfied
+        assignment, satisfied = solution
+        if i not in satisfied:
+            if all(var in assignment for var in self.scopes[i]):
+                # evaluate under the stored assignment, the values of the variables are restored afterwards
+                values = [var._value for var in self.scopes[i]]
+                try:
+                    for var in self.scopes[i]:
+                        var._value = assignment[var]
+                    satisfied[i] = bool(self.soft[i].value())
+                finally:
+                    for var, value in zip(self.scopes[i], values):
+                        var._value = value
+            else:
+                satisfied[i] = False
+        return satisfied[i]
+
+    def _store(self):
+        # store the current values of the variables as satisfying assignment
+        self.solutions.append(({var: var.value() for var in self.variables}, dict()))
 
-def _maxsat_grow(subset, dmap, hard):
-
-    solver = cp.SolverLookup.get("ortools")
-    solver += hard
-    solver += cp.all(subset)
-    for a, cons in dmap.items():
-        solver += a.implies(cons)
-    solver.maximize(cp.sum(list(dmap.keys())))
-    return {a for a in dmap if not a.value()}
-
-def _greedy_grow(dmap):
-    sat_subset = {assump for assump, cons in dmap.items() if assump.value() or cons.value()}
-    return set(dmap.keys()) - sat_subset
-
-def _corr_subsets(subset, dmap, solver, hard):
-    start_time = time()
-    sat_subset = {s for s in subset}
-    corr_subsets = []
-    while solver.solve(assumptions=list(sat_subset)):
-        corr_subset = _maxsat_grow(sat_subset, dmap, hard=hard)
-        # corr_subset = _greedy_grow(dmap)
-        if len(corr_subset) == 0:
-            return corr_subsets
-        sat_subset |= corr_subset
-        corr_subsets.append(corr_subset)
-
-    return corr_subsets
-
-def ocus_oneof(soft, hard=[], oneof_idxes=[], weights=1, solver="ortools", hs_solver="ortools"):
-    start_time = time()
-
-    assump = cp.boolvar(shape=len(soft), name="assump")
-    if len(soft) == 1:
-        assump = cp.cpm_array([assump])
-    m = cp.Model(hard + [assump.implies(soft)])  # each assumption variable implies a candidate
-    dmap = dict(zip(assump, soft))
-    s = cp.SolverLookup.get(solver, m)
-    assert not s.solve(assumptions=assump), "MUS: model must be UNSAT"
-
-    # hitting set solver stuff
-    hs_solver = cp.SolverLookup.get(hs_solver)
-    if len(oneof_idxes):
-        hs_solver += cp.sum(assump[oneof_idxes]) == 1
-    hs_solver.minimize(cp.sum(weights * assump))
-
-    while hs_solver.solve():
-
-        subset = assump[assump.value() == 1]
-        if s.solve(assumptions=subset) is True:
-            # grow subset while staying satisfiable under assumptions
-            for grown in _corr_subsets(subset, dmap, s, hard=hard):
-                hs_solver += cp.sum(grown) >= 1
+    def _grow(self, hard_idxes, soft_idxes, sat_subset):
+        # grow a satisfiable subset of the soft constraints, the oracle has a solution for it
+        if self.grow == "maxsat":
+            self.grow_solver.maximize(cp.sum([self.assump[i] for i in soft_idxes]))
+            self.grow_solver.solve(assumptions=[self.assump[i] for i in hard_idxes + sat_subset])
+            grown = [i for i in soft_idxes if self.assump[i].value()]
         else:
-            return [dmap[a] for a in subset]
+            grown = [i for i in soft_idxes if self.assump[i].value() or self.soft[i].value()]
+        self._store()
+        return grown
+
+    def _corr_subsets(self, hard_idxes, soft_idxes, subset):
+        # disjoint correction subsets of the soft constraints, starting from a satisfiable subset
+        sat_subset = set(subset)
+        corr_subsets = []
+        while self.oracle.solve(assumptions=[self.assump[i] for i in hard_idxes + sorted(sat_subset)]):
+            corr_subset = set(soft_idxes) - set(self._grow(hard_idxes, soft_idxes, sorted(sat_subset)))
+            if len(corr_subset) == 0:
+                return corr_subsets
+            sat_subset |= corr_subset
+            corr_subsets.append(corr_subset)
+        return corr_subsets
+
+    def ocus(self, soft, hard=[], weights=1, oneof_idxes=[]):
+        """
+            Returns the subset of the soft constraints with minimal weight, that is unsatisfiable together with the hard constraints
+            :param oneof_idxes: indices of soft constraints of which exactly one should be in the subset
+        """
+        self._add(list(hard) + list(soft))
+        hard_idxes = [self.index[cons] for cons in hard]
+        soft_idxes = [self.index[cons] for cons in soft]
+        assert not self.oracle.solve(assumptions=[self.assump[i] for i in hard_idxes + soft_idxes]), "MUS: model must be UNSAT"
+
+        # constraints on the hitting sets of this call are only enforced when assuming its activation variable
+        call = cp.boolvar(name=f"call[{self.n_calls}]")
+        self.n_calls += 1
+        assump = cp.cpm_array([self.assump[i] for i in soft_idxes])
+        self.hs_solver.minimize(cp.sum(weights * assump))
+        if len(oneof_idxes):
+            self.hs_solver += call.implies(cp.sum(assump[oneof_idxes]) == 1)
+
+        # assignments of earlier calls satisfying the hard constraints give correction subsets
+        for solution in self.solutions:
+            if all(self._satisfied(solution, i) for i in hard_idxes):
+                corr_subset = [self.assump[i] for i in soft_idxes if not self._satisfied(solution, i)]
+                self.hs_solver += call.implies(cp.any(corr_subset))
+
+        in_call = set(hard_idxes) | set(soft_idxes)
+        hs_assumptions = [call] + [self.assump[i] for i in hard_idxes] + [~var for i, var in enumerate(self.assump) if i not in in_call]
+        while self.hs_solver.solve(assumptions=hs_assumptions):
+
+            subset = [i for i in soft_idxes if self.assump[i].value()]
+            if self.oracle.solve(assumptions=[self.assump[i] for i in hard_idxes + subset]) is True:
+                # grow subset while staying satisfiable under assumptions
+                for grown in self._corr_subsets(hard_idxes, soft_idxes, subset):
+                    self.hs_solver += call.implies(cp.any([self.assump[i] for i in grown]))
+            else:
+                return [self.soft[i] for i in subset]
+
+
+def ocus_oneof(soft, hard=[], oneof_idxes=[], weights=1, solver="ortools", hs_solver="ortools", grow="maxsat"):
+    return OCUSEngine(hard, solver=solver, hs_solver=hs_solver, grow=grow).ocus(soft, weights=weights, oneof_idxes=oneof_idxes)
 
-def smus(soft, hard=[], weights=1, solver="ortools", hs_solver="ortools"):
-    return ocus_oneof(soft, hard, [], weights, solver, hs_solver)
\ No newline at end of file
+def smus(soft, hard=[], weights=1, solver="ortools", hs_solver="ortools", grow="maxsat"):
+    return ocus_oneof(soft, hard, [], weights, solver, hs_solver, grow)
@@ -19,4 +19,14 @@ def print_sequence(seq):
         print(f"  Input: {step['input']}")
         print(f"  Output: {step['output']}")
         print(f"  Constraints: {step['constraints']}")
-        print()
\ No newline at end of file
+        print()
+
+def exhaust(generator):
+    """
+        Consume a generator, returns its return value
+    """
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
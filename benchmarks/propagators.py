@@ -0,0 +1,226 @@
+"""
+    Micro-benchmarks of the propagators on typical propagation calls.
+    Calls propagate a single global constraint or a connected subset of 2-3 constraints, starting from no literals or
+        from a dense set of literals consistent with a solution of the constraints.
+    For each workload, propagator and kind of call, reports latency percentiles, throughput and peak memory as JSON,
+        and compares them to an earlier run to detect regressions.
+
+    Usage, from the parent directory of the repository:
+        python -m SimplifySeq.benchmarks.propagators --output results.json [--compare baseline.json]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import tracemalloc
+from importlib.metadata import version, PackageNotFoundError
+from time import perf_counter, strftime
+
+import numpy as np
+import cpmpy as cp
+from cpmpy.expressions.globalconstraints import GlobalConstraint
+from cpmpy.transformations.normalize import toplevel_list
+
+from ..algorithms.datastructures import LiteralEncoding
+from ..algorithms.propagate import ExactPropagate, MaximalPropagate, MaximalPropagateSolveAll, CPPropagate
+from ..algorithms.utils import get_variables
+from ..datasets.jobshop.jobshop import generate_instance, generate_unsat_instance
+from ..datasets.sudoku.sudoku import load_csv_instance
+from ..experiments.models import sudoku_model, jobshop_model_cumulative, load_unsat_model
+
+PROPAGATORS = dict(exact=ExactPropagate, maximal=MaximalPropagate, solveall=MaximalPropagateSolveAll, cp=CPPropagate)
+KINDS = ("single-empty", "single-dense", "subset-empty", "subset-dense")
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "datasets")
+
+
+def sudoku_workloads(n_instances=1):
+    for fname, size in [("easy_sudokus.csv", "9x9"), ("16x16.csv", "16x16")]:
+        for i, givens in enumerate(load_csv_instance(os.path.join(DATASETS, "sudoku", fname))[:n_instances]):
+            model, _ = sudoku_model(givens)
+            yield f"sudoku-{size}-{i}", model.constraints
+
+
+def jobshop_workloads(n_instances=1):
+    for seed in range(n_instances):
+        for generate in (generate_instance, generate_unsat_instance):
+            inst = generate(jobs=3, machines=3, horizon=20, seed=seed)
+            model, _ = jobshop_model_cumulative(**inst)
+            yield inst['name'] + ("-unsat" if generate is generate_unsat_instance else ""), model.constraints
+
+
+def debug_workloads(n_instances=1):
+    found = 0
+    for fname in sorted(glob.glob(os.path.join(DATASETS, "debug", "unsat_models", "*.pkl"))):
+        if found == n_instances:
+            break
+        try:
+            model, _ = load_unsat_model(fname)
+        except Exception as e:
+            # models pickled with other versions of CPMpy cannot always be loaded
+            print(f"Skipping {os.path.basename(fname)}: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        found += 1
+        yield os.path.basename(fname).replace(".pkl", ""), model.constraints
+
+
+WORKLOADS = dict(sudoku=sudoku_workloads, jobshop=jobshop_workloads, debug=debug_workloads)
+
+
+def make_calls(constraints, n_calls, seed=0):
+    """
+        Returns `n_calls` propagation calls of each kind, as (kind, constraints, literals)
+    """
+    rng = random.Random(seed)
+    scopes = {cons: set(get_variables(cons)) for cons in constraints}
+    singles = [cons for cons in constraints if isinstance(cons, GlobalConstraint)]
+    if len(singles) == 0:
+        singles = [cons for cons in constraints if len(scopes[cons]) > 1] or constraints
+
+    calls = []
+    for kind in KINDS:
+        for _ in range(n_calls):
+            if kind.startswith("single"):
+                subset = [rng.choice(singles)]
+            else:
+                # a constraint with up to two constraints sharing a variable with it
+                cons = rng.choice(constraints)
+                neighbours = [other for other in constraints if other is not cons and len(scopes[cons] & scopes[other])]
+                subset = [cons] + rng.sample(neighbours, min(len(neighbours), rng.randint(1, 2)))
+            literals = _dense_literals(subset, rng) if kind.endswith("dense") else frozenset()
+            calls.append((kind, subset, literals))
+    return calls
+
+
+def _dense_literals(constraints, rng, density=0.5):
+    # remove about half of the values of each variable, but keep the values of a solution if there is one
+    solver = cp.SolverLookup.get("ortools", cp.Model(constraints))
+    has_solution = solver.solve(random_seed=rng.randint(0, 2**16), num_workers=1) is True
+    literals = set()
+    for var in get_variables(constraints):
+        keep = var.value() if has_solution else rng.randint(var.lb, var.ub)
+        literals |= {var != val for val in range(var.lb, var.ub + 1) if val != keep and rng.random() < density}
+    return frozenset(literals)
+
+
+def _summary(latencies):
+    if len(latencies) == 0:
+        return dict(p50=None, p90=None, p99=None, max=None, mean=None, throughput=None)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return dict(p50=float(p50), p90=float(p90), p99=float(p99), max=max(latencies), mean=float(np.mean(latencies)),
+                throughput=len(latencies) / sum(latencies) if sum(latencies) > 0 else None)
+
+
+def run_propagator(name, constraints, calls, time_limit=10):
+    """
+        Replay the calls on a fresh propagator without cache, returns the results for each kind of call.
+        Peak memory is measured with tracemalloc, so only counts memory allocated by Python, not by the native solvers.
+    """
+    # all propagators share an encoding, so literals are encoded once
+    encoding = LiteralEncoding(get_variables(constraints))
+    encoded = [(kind, subset, encoding.encode(literals)) for kind, subset, literals in calls]
+
+    tracemalloc.start()
+    start = perf_counter()
+    propagator = PROPAGATORS[name](constraints, caching=False, encoding=encoding)
+    setup_time = perf_counter() - start
+
+    results = []
+    for kind in KINDS:
+        tracemalloc.reset_peak()
+        latencies, timeouts = [], 0
+        for call_kind, subset, literals in encoded:
+            if call_kind != kind:
+                continue
+            start = perf_counter()
+            try:
+                propagator.propagate_bits(literals, subset, time_limit=time_limit)
+            except TimeoutError:
+                timeouts += 1
+                continue
+            latencies.append(perf_counter() - start)
+        results.append(dict(propagator=name, kind=kind, n_calls=len(latencies), timeouts=timeouts, setup_time=setup_time,
+                            peak_memory=tracemalloc.get_traced_memory()[1], **_summary(latencies)))
+    tracemalloc.stop()
+    return results
+
+
+def run(workloads=tuple(WORKLOADS), propagators=tuple(PROPAGATORS), n_instances=1, n_calls=20, seed=0, time_limit=10):
+    """
+        Run the benchmark, returns a dict with the versions of the environment and a list of results
+    """
+    results = []
+    for workload in workloads:
+        for instance, constraints in WORKLOADS[workload](n_instances):
+            constraints = toplevel_list(constraints, merge_and=False)
+            calls = make_calls(constraints, n_calls, seed=seed)
+            for name in propagators:
+                print(f"Benchmarking {name} on {instance}", file=sys.stderr)
+                for result in run_propagator(name, constraints, calls, time_limit=time_limit):
+                    results.append(dict(workload=workload, instance=instance, **result))
+    return dict(meta=environment(), results=results)
+
+
+def environment():
+    versions = dict()
+    for package in ("cpmpy", "exact", "ortools"):
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return dict(time=strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(), platform=platform.platform(), **versions)
+
+
+def compare(results, baseline, threshold=1.5, statistic="p50"):
+    """
+        Returns the results whose statistic is more than `threshold` times the one of the same benchmark in the baseline
+    """
+    key = lambda res: (res['instance'], res['propagator'], res['kind'])
+    base = {key(res): res for res in baseline['results']}
+    regressions = []
+    for res in results['results']:
+        old = base.get(key(res))
+        if old is None or old[statistic] is None or res[statistic] is None:
+            continue
+        if res[statistic] > threshold * old[statistic]:
+            regressions.append(dict(instance=res['instance'], propagator=res['propagator'], kind=res['kind'],
+                                    baseline=old[statistic], current=res[statistic]))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'instance':<32} {'propagator':<10} {'kind':<13} {'p50 (ms)':>9} {'p99 (ms)':>9} {'calls/s':>8} {'peak (KB)':>10}")
+    fmt = lambda val, scale: f"{val * scale:.2f}" if val is not None else "-"
+    for res in results['results']:
+        print(f"{res['instance']:<32} {res['propagator']:<10} {res['kind']:<13} {fmt(res['p50'], 1e3):>9} {fmt(res['p99'], 1e3):>9} "
+              f"{fmt(res['throughput'], 1):>8} {res['peak_memory'] / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the propagators")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--propagators", nargs="+", default=list(PROPAGATORS), choices=list(PROPAGATORS))
+    parser.add_argument("--instances", type=int, default=1, help="number of instances of each workload")
+    parser.add_argument("--calls", type=int, default=20, help="number of calls of each kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--time-limit", type=float, default=10, help="time limit of a single call")
+    parser.add_argument("--output", help="path of the JSON file to write the results to")
+    parser.add_argument("--compare", help="path of the JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown of the median latency reported as regression")
+    args = parser.parse_args()
+
+    results = run(args.workloads, args.propagators, args.instances, args.calls, args.seed, args.time_limit)
+    print_table(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), threshold=args.threshold)
+        for reg in regressions:
+            print(f"Regression on {reg['instance']} {reg['propagator']} {reg['kind']}: "
+                  f"{reg['baseline'] * 1e3:.2f}ms -> {reg['current'] * 1e3:.2f}ms", file=sys.stderr)
+        sys.exit(1 if len(regressions) else 0)
@@ -9,7 +9,7 @@ def make_sudoku_unsat(givens, seed):
     dim,_ = givens.shape
     random.seed(seed)
 
-    cells = cp.intvar(1,9, givens.shape, name="cells")
+    cells = cp.intvar(1,dim, givens.shape, name="cells")
     idxes = [(i,j) for i in range(dim) for j in range(dim) if givens[i,j] == 0]
 
     m = cp.Model(cells[givens != 0] == givens[givens != 0])
@@ -24,7 +24,7 @@ def make_sudoku_unsat(givens, seed):
     while 1:
         # make 1 error
         i,j = random.choice(idxes)
-        options = set(range(1,10))
+        options = set(range(1,dim+1))
         # delete correct value
         options.remove(cells[i,j].value())
         # delete row options
@@ -53,9 +53,11 @@ def load_csv_instance(fname):
     with open(fname) as csv_file:
         csv_reader = csv.DictReader(csv_file, delimiter=',')
         for row in csv_reader:
-            dim = int(len(row["Puzzle"]) ** (0.5))
+            # puzzles of dimension larger than 9 have space-separated values
+            puzzle = row["Puzzle"].split() if " " in row["Puzzle"].strip() else row["Puzzle"]
+            dim = int(len(puzzle) ** (0.5))
             all_instances.append(np.array(
-                [[int(row["Puzzle"][i * 9 + j]) for j in range(dim)] for i in range(dim)]
+                [[int(puzzle[i * dim + j]) for j in range(dim)] for i in range(dim)]
             ))
     return all_instances
 
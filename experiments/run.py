@@ -0,0 +1,207 @@
+"""
+    Run `find_sequence` over a corpus of instances, each instance in its own worker process.
+    Per-stage timings, sequence lengths and cache statistics are streamed to a JSONL results file, one record per line.
+    Instances with a "done" record in the results file are skipped, so an interrupted run is resumed by running it again.
+
+    Datasets are given as specs:
+        sudoku:<csv file in datasets/sudoku>[:<number of instances>]   unsatisfiable sudokus, made unsat with seed = index
+        jobshop:<jobs>x<machines>x<horizon>[:<number of seeds>]       unsatisfiable generated jobshop instances
+        debug[:<glob pattern in datasets/debug/unsat_models>]          unsatisfiable models with a modelling mistake
+
+    Usage, from the parent directory of the repository:
+        python -m SimplifySeq.experiments.run sudoku:easy_sudokus.csv:10 jobshop:3x3x20:5 --propagator maximal --output results.jsonl --workers 4
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import traceback
+from time import time
+
+from ..algorithms import construct_greedy, filter_sequence, relax_sequence
+from ..algorithms.cache import PropagationCache
+from ..algorithms.propagate import ExactPropagate, MaximalPropagate, CPPropagate
+from ..algorithms.scheduling import SuccessPriorScheduler
+from ..algorithms.stats import Stats
+from ..algorithms.utils import UNSAT
+from ..datasets.jobshop.jobshop import generate_unsat_instance
+from ..datasets.sudoku.sudoku import load_csv_instance, make_sudoku_unsat
+from .models import sudoku_model, jobshop_model_cumulative, load_unsat_model
+
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "datasets")
+PROPAGATORS = dict(exact=ExactPropagate, maximal=MaximalPropagate, cp=CPPropagate)
+SCHEDULERS = dict(none=None, success=SuccessPriorScheduler)
+
+
+def instances(spec):
+    """
+        Returns the instances of a dataset spec, as (instance id, dataset, argument to build the model)
+    """
+    dataset, *args = spec.split(":")
+    if dataset == "sudoku":
+        fname = os.path.join(DATASETS, "sudoku", args[0])
+        n = int(args[1]) if len(args) > 1 else None
+        return [(f"sudoku/{args[0]}/{i}", "sudoku", (fname, i)) for i in range(len(load_csv_instance(fname)[:n]))]
+    if dataset == "jobshop":
+        jobs, machines, horizon = map(int, args[0].split("x"))
+        n = int(args[1]) if len(args) > 1 else 1
+        return [(f"jobshop/{args[0]}/{seed}", "jobshop", (jobs, machines, horizon, seed)) for seed in range(n)]
+    if dataset == "debug":
+        pattern = args[0] if len(args) else "*.pkl"
+        fnames = sorted(glob.glob(os.path.join(DATASETS, "debug", "unsat_models", pattern)))
+        return [(f"debug/{os.path.basename(fname)}", "debug", fname) for fname in fnames]
+    raise ValueError(f"Unknown dataset {dataset} in spec {spec}")
+
+
+def build_model(dataset, arg):
+    if dataset == "sudoku":
+        fname, i = arg
+        model, _ = sudoku_model(**make_sudoku_unsat(load_csv_instance(fname)[i], seed=i))
+    elif dataset == "jobshop":
+        model, _ = jobshop_model_cumulative(**generate_unsat_instance(*arg))
+    else:
+        model, _ = load_unsat_model(arg)
+    return model.constraints
+
+
+def _run_instance(instance, dataset, arg, options, results):
+    # runs in a worker process, sends records to the results queue
+    send = lambda event, **record: results.put(dict(instance=instance, event=event, **record))
+    if options['memory_limit'] is not None:
+        limit = int(options['memory_limit'] * 2**20)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    start_time = time()
+    remaining = lambda: options['time_limit'] - (time() - start_time)
+    seq, stats = None, Stats()
+    try:
+        constraints = build_model(dataset, arg)
+        send("start", n_constraints=len(constraints))
+        propagator = PROPAGATORS[options['propagator']]
+
+        stage_start, cache = time(), PropagationCache(max_entries=options['cache_size'])
+        seq = construct_greedy(constraints, UNSAT, remaining(), options['seed'], PROP=propagator, caching=cache,
+                               scheduler=SCHEDULERS[options['scheduler']], stats=stats)
+        send("stage", stage="greedy", time=time() - stage_start, length=len(seq), cache=cache.stats())
+
+        stage_start, cache = time(), PropagationCache(max_entries=options['cache_size'])
+        seq = filter_sequence(seq, UNSAT, remaining(), propagator_class=propagator, caching=cache, deletion=options['deletion'],
+                              stats=stats)
+        send("stage", stage="filter", time=time() - stage_start, length=len(seq), cache=cache.stats())
+
+        stage_start = time()
+        seq = relax_sequence(seq, time_limit=remaining(), mode=options['relax_mode'], stats=stats)
+        send("stage", stage="relax", time=time() - stage_start, length=len(seq), cache=None)
+        status = "ok"
+    except TimeoutError:
+        status = "timeout"
+    except MemoryError:
+        status = "memout"
+    except Exception:
+        send("error", traceback=traceback.format_exc())
+        status = "error"
+    send("done", status=status, time=time() - start_time, length=len(seq) if seq is not None else None, stats=stats.summary())
+
+
+def finished(path):
+    """
+        Returns the ids of the instances with a "done" record in the results file
+    """
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # partially written line of an interrupted run
+            if record.get("event") == "done":
+                done.add(record['instance'])
+    return done
+
+
+def run(specs, output, n_workers=1, time_limit=3600, memory_limit=None, grace=60, propagator="exact", scheduler="none", seed=0,
+        cache_size=None, deletion="linear", relax_mode="mus", target=_run_instance):
+    """
+        Run all instances of the dataset specs that are not finished yet, each in its own process.
+        :param time_limit: time limit of an instance in seconds, the process is killed `grace` seconds after it
+        :param memory_limit: limit on the address space of a worker process in MB
+        :param target: function run in the worker process of an instance, with the same arguments as `_run_instance`
+        The other options are names of the propagator and scheduler, and arguments of the stages of `find_sequence`
+    """
+    options = dict(time_limit=time_limit, memory_limit=memory_limit, propagator=propagator, scheduler=scheduler, seed=seed,
+                   cache_size=cache_size, deletion=deletion, relax_mode=relax_mode)
+    done = finished(output)
+    todo = [inst for spec in specs for inst in instances(spec)]
+    print(f"Running {sum(inst[0] not in done for inst in todo)} instances, skipping {sum(inst[0] in done for inst in todo)} finished ones",
+          file=sys.stderr)
+    todo = [inst for inst in todo if inst[0] not in done]
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    running = dict() # instance id -> (process, deadline)
+    with open(output, "a") as f:
+
+        def write(record):
+            # records sent by a worker after it was killed or declared crashed are dropped
+            if record['instance'] in done:
+                return
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            if record['event'] == "done":
+                print(f"{record['instance']}: {record['status']}" + (f" in {record['time']:.1f}s" if record['time'] is not None else ""),
+                      file=sys.stderr)
+                done.add(record['instance'])
+                process, _ = running.pop(record['instance'], (None, None))
+                if process is not None:
+                    process.join()
+
+        while len(todo) or len(running):
+            while len(todo) and len(running) < n_workers:
+                instance, dataset, arg = todo.pop(0)
+                process = ctx.Process(target=target, args=(instance, dataset, arg, options, results), daemon=True)
+                process.start()
+                running[instance] = (process, time() + time_limit + grace)
+
+            # processes that exited without a "done" record crashed, e.g. killed by the OS
+            exited = [instance for instance, (process, _) in running.items() if not process.is_alive()]
+            try:
+                write(results.get(timeout=1))
+                while True:
+                    write(results.get_nowait())
+            except queue.Empty:
+                pass
+            for instance in exited:
+                if instance in running:
+                    write(dict(instance=instance, event="done", status="crashed", time=None, length=None,
+                               exitcode=running[instance][0].exitcode))
+
+            for instance, (process, deadline) in list(running.items()):
+                if time() > deadline:
+                    process.kill()
+                    write(dict(instance=instance, event="done", status="killed", time=None, length=None))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run find_sequence over a corpus of instances")
+    parser.add_argument("specs", nargs="+", help="dataset specs, see the module docstring")
+    parser.add_argument("--output", required=True, help="JSONL results file, finished instances in it are skipped")
+    parser.add_argument("--workers", type=int, default=1, help="number of instances run in parallel")
+    parser.add_argument("--time-limit", type=float, default=3600, help="time limit of an instance in seconds")
+    parser.add_argument("--grace", type=float, default=60, help="seconds after the time limit at which an instance is killed")
+    parser.add_argument("--memory-limit", type=float, default=None, help="limit on the address space of an instance in MB, the solvers alone take a few hundred MB")
+    parser.add_argument("--propagator", default="exact", choices=list(PROPAGATORS))
+    parser.add_argument("--scheduler", default="none", choices=list(SCHEDULERS), help="order of candidate steps in greedy construction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-size", type=int, default=None, help="maximum number of entries in the propagation cache")
+    parser.add_argument("--deletion", default="linear", choices=["linear", "quickxplain"])
+    parser.add_argument("--relax-mode", default="mus", choices=["mus", "ocus"])
+    args = parser.parse_args()
+
+    run(args.specs, args.output, n_workers=args.workers, time_limit=args.time_limit, memory_limit=args.memory_limit, grace=args.grace,
+        propagator=args.propagator, scheduler=args.scheduler, seed=args.seed, cache_size=args.cache_size, deletion=args.deletion, relax_mode=args.relax_mode)
@@ -1,11 +1,14 @@
 from unittest import TestCase
+from unittest.mock import patch
 import pickle
 
 import cpmpy as cp
 from cpmpy.expressions.variables import _IntVarImpl, _BoolVarImpl, NegBoolView
 
-from ..algorithms.backward import filter_sequence, relax_sequence
+from ..algorithms.backward import ConflictChecker, MUSEngine, filter_sequence, relax_sequence
 from ..algorithms.propagate import ExactPropagate, MaximalPropagateSolveAll
+from ..algorithms.datastructures import LiteralEncoding
+from ..algorithms.forward import construct_greedy
 from ..algorithms.utils import UNSAT, print_sequence
 
 
@@ -51,6 +54,22 @@ class TestBackward(TestCase):
         self.assertEqual(len(filtered), 3)
 
 
+    def test_filter_quickxplain(self):
+        filtered = filter_sequence(self.redundant_var_seq, goal_literals=UNSAT, time_limit=100, deletion="quickxplain")
+        self.assertEqual(len(filtered), 3)
+
+        x = cp.intvar(1, 4, shape=(4, 4), name="x")
+        constraints = [cp.AllDifferent(row) for row in x] + [cp.AllDifferent(col) for col in x.T]
+        constraints += [x[0, 0] == 1, x[1, 1] == 1, x[2, 2] == 2, x[3, 3] == 2, x[2, 3] == 3]
+        seq = construct_greedy(constraints, goal_literals=UNSAT, time_limit=120, seed=0)
+
+        filtered = filter_sequence(seq, goal_literals=UNSAT, time_limit=100, deletion="quickxplain")
+        self.assertLessEqual(len(filtered), len(seq))
+        self.assertTrue(UNSAT <= filtered[-1]['output'])
+        for step in filtered:
+            propagator = ExactPropagate(list(step['constraints']))
+            self.assertTrue(step['output'] <= propagator.propagate(step['input'], list(step['constraints']), time_limit=10))
+
     def test_relax_strongly_redundant(self):
         filtered = relax_sequence(self.redundant_var_seq, time_limit=100)
         self.assertEqual(len(filtered), 3)
@@ -81,6 +100,59 @@ class TestBackward(TestCase):
 
         self.assertEqual(len(filtered), 2)
 
+    def test_conflict_checker(self):
+        x, y, z = [cp.intvar(0, 3, name=n) for n in "xyz"]
+        c1, c2, c3 = x + y <= 2, y + z <= 2, x == z
+
+        encoding = LiteralEncoding([x, y, z])
+        for solver in ("exact", "ortools"):
+            checker = ConflictChecker([c1, c2, c3], encoding, solver=solver)
+
+            literals = encoding.encode({y != 0, y != 1})
+            self.assertTrue(checker.has_conflict(0b011, literals | encoding.encode({x != 0, x != 1})))
+            self.assertFalse(checker.has_conflict(0b111, literals))
+            self.assertTrue(checker.has_conflict(0b000, encoding.encode(UNSAT)))
+            # only literals that were checked are guarded
+            self.assertEqual(checker.guarded, literals | encoding.encode({x != 0, x != 1}))
+
+            # implied by the stored core and satisfiable assignment, answered without the solver
+            checker.solver = None
+            self.assertTrue(checker.has_conflict(0b111, literals | encoding.encode({x != 0, x != 1, z != 3})))
+            self.assertFalse(checker.has_conflict(0b101, literals))
+
+    def test_filter_checker_solver(self):
+        # with an OR-Tools propagator, filtering does not need Exact
+        get = cp.SolverLookup.get
+        def no_exact(name=None, *args, **kwargs):
+            assert name != "exact", "Exact should not be used"
+            return get(name, *args, **kwargs)
+
+        with patch.object(cp.SolverLookup, "get", side_effect=no_exact):
+            for checker_solver in (None, "ortools", False):
+                filtered = filter_sequence(self.redundant_var_seq, goal_literals=UNSAT, time_limit=100,
+                                           propagator_class=MaximalPropagateSolveAll, checker_solver=checker_solver)
+                self.assertEqual(len(filtered), 3)
+
+    def test_mus_engine(self):
+        x, y = [cp.intvar(0, 3, name=n) for n in "xy"]
+        c1, c2 = x >= 2, x + y <= 3
+
+        encoding = LiteralEncoding([x, y])
+        engine = MUSEngine([c1, c2], encoding)
+
+        # x + y <= 3 derives y <= 1 from x >= 2
+        output = encoding.encode({y != 2, y != 3})
+        self.assertEqual(engine.mus(soft=encoding.encode({x != 0, x != 1, y != 0}), hard=0, cons_bits=0b10, output=output),
+                         encoding.encode({x != 0, x != 1}))
+        # no literals are needed when x >= 2 is a constraint of the step
+        self.assertEqual(engine.mus(soft=encoding.encode({x != 0, x != 1, y != 0}), hard=0, cons_bits=0b11, output=output), 0)
+        # hard literals are not part of the MUS
+        self.assertEqual(engine.mus(soft=encoding.encode({x != 1, y != 0}), hard=encoding.encode({x != 0}), cons_bits=0b10, output=output),
+                         encoding.encode({x != 1}))
+        # deriving False needs an inconsistent set of literals
+        self.assertEqual(engine.mus(soft=encoding.encode({x != 2, x != 3, y != 0}), hard=0, cons_bits=0b01, output=encoding.encode(UNSAT)),
+                         encoding.encode({x != 2, x != 3}))
+
     def test_relax(self):
 
         x,y,z = [cp.intvar(0,5, name=n) for n in "xyz"]
@@ -101,4 +173,20 @@ class TestBackward(TestCase):
 
         self.assertEqual(len(relaxed), 2)
         self.assertSetEqual(relaxed[1]['input'], {x != 4, x != 5})
-        
\ No newline at end of file
+        
+    def test_relax_ocus(self):
+
+        x, y, z = [cp.intvar(0, 3, name=n) for n in "xyz"]
+
+        step1 = dict(input=frozenset(), constraints=[x <= 1], output=frozenset({x != 2, x != 3}))
+        step2 = dict(input=step1['output'], constraints=[y <= 1], output=frozenset({y != 2, y != 3}))
+        step3 = dict(input=step1['output'] | step2['output'], constraints=[(z <= x) & (z <= y)], output=frozenset({z != 2, z != 3}))
+        step4 = dict(input=step1['output'] | step2['output'] | step3['output'], constraints=[x + z >= 3], output=UNSAT)
+
+        for mode in ("mus", "ocus"):
+            relaxed = relax_sequence([step1, step2, step3, step4], mode=mode)
+
+            # z <= 1 follows from either x <= 1 or y <= 1, but x <= 1 is required anyway
+            self.assertEqual(len(relaxed), 3)
+            self.assertSetEqual(relaxed[1]['input'], {x != 2, x != 3})
+            self.assertSetEqual(relaxed[2]['input'], {x != 2, x != 3, z != 2, z != 3})
@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+import cpmpy as cp
+from cpmpy.transformations.normalize import toplevel_list
+
+from ..benchmarks.propagators import KINDS, compare, make_calls, run_propagator
+
+
+class TestBenchmarks(TestCase):
+
+    def test_propagators(self):
+        x = cp.intvar(1, 4, shape=(4, 4), name="x")
+        constraints = [cp.AllDifferent(row) for row in x] + [cp.AllDifferent(col) for col in x.T]
+        constraints = toplevel_list(constraints + [x[0, 0] == 1, x[1, 1] == 2], merge_and=False)
+
+        calls = make_calls(constraints, n_calls=2, seed=0)
+        self.assertEqual(len(calls), 2 * len(KINDS))
+        self.assertTrue(all(len(subset) == 1 for kind, subset, _ in calls if kind.startswith("single")))
+        self.assertTrue(all(len(lits) == 0 for kind, _, lits in calls if kind.endswith("empty")))
+
+        results = run_propagator("exact", constraints, calls)
+        self.assertListEqual([res['kind'] for res in results], list(KINDS))
+        self.assertTrue(all(res['n_calls'] == 2 and res['p50'] <= res['max'] for res in results))
+
+        # a run is a regression of a run that was twice as fast
+        current = dict(results=[dict(res, instance="4x4") for res in results])
+        baseline = dict(results=[dict(res, instance="4x4", p50=res['p50'] / 2) for res in results])
+        self.assertEqual(len(compare(current, baseline, threshold=1.5)), len(KINDS))
+        self.assertEqual(len(compare(current, current, threshold=1.5)), 0)
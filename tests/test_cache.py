@@ -0,0 +1,145 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+
+import cpmpy as cp
+
+from ..algorithms.cache import PropagationCache, PersistentCache, SolutionPool
+from ..algorithms.propagate import ExactPropagate, MaximalPropagate, MaximalPropagateSolveAll
+
+
+class TestPropagationCache(TestCase):
+
+    def test_lru(self):
+        cache = PropagationCache(max_entries=2)
+        cache.put("a", 0, 1)
+        cache.put("b", 0, 2)
+        self.assertEqual(cache.get("a", 0), 1) # a is now most recently used
+        cache.put("c", 0, 3)
+
+        self.assertIsNone(cache.get("b", 0))
+        self.assertEqual(cache.get("a", 0), 1)
+        self.assertEqual(cache.get("c", 0), 3)
+        self.assertDictEqual(cache.stats(), dict(hits=3, misses=1, evictions=1, entries=2, bytes=cache.n_bytes))
+
+    def test_cost(self):
+        cache = PropagationCache(max_entries=2, policy="cost")
+        cache.put("expensive", 0, 1, cost=10)
+        cache.put("cheap", 0, 2, cost=1)
+        cache.put("new", 0, 3, cost=5)
+
+        # cheapest entry to recompute is evicted
+        self.assertNotIn(("cheap", 0), cache)
+        self.assertIn(("expensive", 0), cache)
+        self.assertIn(("new", 0), cache)
+
+    def test_bytes(self):
+        cache = PropagationCache(max_bytes=1000)
+        for i in range(100):
+            cache.put("a", i, 1 << 1000)
+        self.assertLessEqual(cache.n_bytes, 1000)
+        self.assertEqual(cache.evictions, 100 - len(cache))
+
+    def test_propagator(self):
+        x = cp.intvar(0, 5, shape=3, name="x")
+        c1 = cp.sum(x) <= 2
+
+        propagator = ExactPropagate([c1], caching=PropagationCache(max_entries=1))
+        propagator.propagate(frozenset(), c1, time_limit=10)
+        propagator.propagate(frozenset(), c1, time_limit=10)
+        propagator.propagate(frozenset({x[0] != 0}), c1, time_limit=10)
+
+        stats = propagator.cache_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+
+class TestSolutionPool(TestCase):
+
+    def test_supported(self):
+        pool = SolutionPool(max_solutions=2)
+        pool.add(["a", "b"], 0b0110)
+        pool.add(["a"], 0b1000)
+        self.assertEqual(pool.supported(["a"], 0), 0b1110)
+        self.assertEqual(pool.supported(["a", "b"], 0), 0b0110)
+        self.assertEqual(pool.supported(["a"], 0b0010), 0b1000) # inconsistent with the literals
+        self.assertEqual(pool.supported(["c"], 0), 0)
+
+        pool.add(["b"], 0b10000)
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.supported(["a"], 0), 0b1000) # oldest solution is removed
+
+    def test_propagators(self):
+        x = cp.intvar(0, 3, shape=3, name="x")
+        c1 = cp.AllDifferent(x)
+        c2 = x[0] + x[1] <= 2
+        c3 = x[2] >= 1
+
+        for PROP in [MaximalPropagate, MaximalPropagateSolveAll]:
+            propagator = PROP([c1, c2, c3], caching=False)
+            without_pool = PROP([c1, c2, c3], caching=False, solution_pool=False)
+            for literals, constraints in [(frozenset(), [c1, c2, c3]), (frozenset(), [c1, c2]),
+                                          (frozenset({x[0] != 0}), [c1, c2]), (frozenset({x[2] != 3}), [c1])]:
+                self.assertSetEqual(propagator.propagate(literals, constraints, time_limit=10),
+                                    without_pool.propagate(literals, constraints, time_limit=10))
+            self.assertGreater(len(propagator.solution_pool), 0)
+
+
+class TestPersistentCache(TestCase):
+
+    def test_across_propagators(self):
+        x = cp.intvar(0, 5, shape=3, name="x")
+        c1 = cp.sum(x) <= 2
+        c2 = x[0] + x[1] >= 6
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            propagator = ExactPropagate([c1, c2], persistent_cache=path)
+            literals = propagator.propagate(frozenset({x[2] != 0}), c1, time_limit=10)
+            unsat = propagator.propagate(frozenset(), [c1, c2], time_limit=10)
+            propagator.persistent_cache.close()
+
+            # new propagator, e.g., in a later run, answers from disk
+            propagator = ExactPropagate([c1, c2], persistent_cache=PersistentCache(path))
+            self.assertSetEqual(propagator.propagate(frozenset({x[2] != 0}), c1, time_limit=10), literals)
+            self.assertSetEqual(propagator.propagate(frozenset(), [c1, c2], time_limit=10), unsat)
+            self.assertEqual(propagator.cache_stats()['persistent_hits'], 2)
+            self.assertEqual(propagator.cache_stats()['persistent_misses'], 0)
+
+            # only the path is pickled, e.g., when sending to worker processes
+            cache = pickle.loads(pickle.dumps(propagator.persistent_cache))
+            self.assertEqual(cache.path, path)
+            propagator.persistent_cache.close()
+
+    def test_bounds(self):
+        # same names and constraint strings, but other domains, do not share entries
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            x = cp.intvar(0, 5, shape=2, name="x")
+            propagator = ExactPropagate([x[0] < x[1]], persistent_cache=path)
+            self.assertSetEqual(propagator.propagate(frozenset(), [x[0] < x[1]], time_limit=10), {x[0] != 5, x[1] != 0})
+            propagator.persistent_cache.close()
+
+            x = cp.intvar(0, 3, shape=2, name="x")
+            propagator = ExactPropagate([x[0] < x[1]], persistent_cache=path)
+            self.assertSetEqual(propagator.propagate(frozenset(), [x[0] < x[1]], time_limit=10), {x[0] != 3, x[1] != 0})
+            self.assertEqual(propagator.cache_stats()['persistent_hits'], 0)
+            propagator.persistent_cache.close()
+
+    def test_batches(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            cache, reader = PersistentCache(path, batch_size=2), PersistentCache(path)
+            cache.put("a", "1", None)
+            # pending entries are answered by the cache itself, but are not written yet
+            self.assertIsNone(cache.get("a", "1"))
+            self.assertFalse(reader.get("a", "1"))
+            cache.put("b", "1", [["x", 1]])
+            self.assertIsNone(reader.get("a", "1"))
+            self.assertListEqual(reader.get("b", "1"), [["x", 1]])
+            cache.put("c", "1", None)
+            cache.close()
+            self.assertIsNone(reader.get("c", "1"))
+            reader.close()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import cpmpy as cp
+from cpmpy.transformations.normalize import toplevel_list
+
+from ..algorithms import find_sequence, forward
+from ..algorithms.checkpoint import Checkpoint
+from ..algorithms.forward import construct_greedy
+from ..algorithms.propagate import ExactPropagate
+from ..algorithms.utils import UNSAT
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        x = cp.intvar(1, 4, shape=(4, 4), name="x")
+        constraints = [cp.AllDifferent(row) for row in x] + [cp.AllDifferent(col) for col in x.T]
+        constraints += [x[0, 0] == 1, x[1, 1] == 1, x[2, 2] == 2, x[3, 3] == 2, x[2, 3] == 3]
+        self.constraints = toplevel_list(constraints, merge_and=False)
+
+    def test_resume_greedy(self):
+        seq = construct_greedy(self.constraints, goal_literals=UNSAT, time_limit=120, seed=0)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint.pkl")
+            # interrupted after two steps
+            checkpoint = Checkpoint(path, self.constraints)
+            checkpoint.save("greedy", seq[:2], force=True, literals=seq[1]['input'] | seq[1]['output'])
+
+            # resume in a "new process", with a fresh copy of the model
+            checkpoint = Checkpoint(path, self.constraints)
+            self.assertEqual(checkpoint.load(), "greedy")
+            resumed = construct_greedy(self.constraints, goal_literals=UNSAT, time_limit=120, seed=0, checkpoint=checkpoint)
+
+        self.assertEqual(len(resumed), len(seq))
+        for step, resumed_step in zip(seq, resumed):
+            self.assertSetEqual(step['constraints'], resumed_step['constraints'])
+            self.assertSetEqual(step['output'], resumed_step['output'])
+
+    def test_cache(self):
+        x = cp.intvar(0, 5, shape=3, name="x")
+        c1 = cp.sum(x) <= 2
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint.pkl")
+            propagator = ExactPropagate([c1])
+            propagator.propagate(frozenset({x[0] != 0}), [c1], time_limit=10)
+            checkpoint = Checkpoint(path, [c1], include_cache=True)
+            checkpoint.save("filter", [], propagator=propagator, force=True, i=3)
+
+            propagator = ExactPropagate([c1])
+            checkpoint = Checkpoint(path, [c1])
+            checkpoint.load()
+            self.assertIsNone(checkpoint.resume("relax", propagator)) # checkpoint of other stage
+            self.assertEqual(checkpoint.resume("filter", propagator), dict(seq=[], i=3))
+            self.assertEqual(len(propagator.cache), 1)
+
+    def test_find_sequence(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint.pkl")
+            seq = find_sequence(self.constraints, checkpoint_path=path, time_limit=120)
+
+            # the finished sequence is returned without running any stage again
+            self.assertEqual(Checkpoint(path, self.constraints).load(), "done")
+            resumed = find_sequence(self.constraints, resume_from=path, time_limit=120)
+            self.assertEqual(len(resumed), len(seq))
+
+            # checkpoints of other models are rejected
+            self.assertRaisesRegex(ValueError, path, lambda: Checkpoint(path, self.constraints[:-1]).load())
+
+    def test_timeout_in_step(self):
+        # the third step times out, the checkpoint is saved even though the interval did not pass
+        next_step = forward._smallest_next_step
+        n_steps = []
+        def timing_out(*args, **kwargs):
+            n_steps.append(1)
+            if len(n_steps) == 3:
+                raise TimeoutError("timed out in step")
+            return next_step(*args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint.pkl")
+            checkpoint = Checkpoint(path, self.constraints, interval=3600)
+            with patch.object(forward, "_smallest_next_step", side_effect=timing_out):
+                self.assertRaises(TimeoutError, construct_greedy, self.constraints, goal_literals=UNSAT, time_limit=120, seed=0,
+                                  checkpoint=checkpoint)
+
+            checkpoint = Checkpoint(path, self.constraints)
+            self.assertEqual(checkpoint.load(), "greedy")
+            self.assertEqual(len(checkpoint.sequence()), 2)
@@ -0,0 +1,129 @@
+import random
+from unittest import TestCase
+from itertools import combinations
+
+import cpmpy as cp
+from cpmpy.transformations.get_variables import get_variables
+
+from ..algorithms.datastructures import ConstraintGraph, LiteralEncoding, SetTrie, SuffixTrie, UNSAT_BIT
+from ..algorithms.utils import UNSAT
+
+
+def connected(constraints, idxes):
+    # breadth-first search from the first constraint, over constraints sharing a variable
+    scopes = {i: set(get_variables(constraints[i])) for i in idxes}
+    seen, queue = {idxes[0]}, [idxes[0]]
+    while len(queue):
+        i = queue.pop(0)
+        for j in idxes:
+            if j not in seen and len(scopes[i] & scopes[j]):
+                seen.add(j)
+                queue.append(j)
+    return len(seen) == len(idxes)
+
+
+class TestConstraintGraph(TestCase):
+
+    def setUp(self) -> None:
+        x = cp.intvar(0, 3, shape=6, name="x")
+        self.constraints = [x[0] < x[1], x[1] < x[2], x[2] != x[3], x[4] + x[5] <= 3, x[3] >= x[4], x[0] == 2]
+
+    def test_connected_subsets(self):
+        graph = ConstraintGraph(self.constraints)
+
+        for size in range(1, len(self.constraints)+1):
+            brute_force = [idxes for idxes in combinations(range(len(self.constraints)), size)
+                           if connected(self.constraints, idxes)]
+            self.assertListEqual(sorted(graph.connected_subsets(size)), brute_force)
+
+    def test_is_connected(self):
+        graph = ConstraintGraph(self.constraints)
+
+        self.assertTrue(graph.is_connected([0, 1, 2]))
+        self.assertFalse(graph.is_connected([0, 3]))
+        self.assertTrue(graph.is_connected([0, 1, 2, 4, 3]))
+
+
+class TestLiteralEncoding(TestCase):
+
+    def test_encode_decode(self):
+        x = cp.intvar(1, 4, shape=2, name="x")
+        b = cp.boolvar(name="b")
+        encoding = LiteralEncoding(list(x))
+
+        literals = frozenset({x[0] != 2, x[1] != 1, x[1] != 4})
+        bits = encoding.encode(literals)
+        self.assertSetEqual(encoding.decode(bits), literals)
+        self.assertEqual(encoding.encode(UNSAT), UNSAT_BIT)
+
+        # variables are added on first use
+        bits |= encoding.encode({b != 0})
+        self.assertSetEqual(encoding.decode(bits), literals | {b != 0})
+
+    def test_domains(self):
+        x = cp.intvar(1, 4, shape=2, name="x")
+        encoding = LiteralEncoding(list(x))
+
+        bits = encoding.encode({x[0] != 2, x[1] != 1, x[1] != 4})
+        self.assertListEqual(encoding.domain(bits, x[1]), [2, 3])
+        self.assertEqual(encoding.restrict(x[1], [2, 3]), bits & encoding.scope_mask([x[1]]))
+        self.assertEqual(bits & encoding.scope_mask([x[0]]), encoding.exclude(x[0], [2]))
+        self.assertListEqual(encoding.variables(bits), list(x))
+
+        # subset checks are bitwise operations
+        self.assertEqual(encoding.encode({x[1] != 1}) & ~bits, 0)
+
+
+class TestSuffixTrie(TestCase):
+
+    def test_suffixes(self):
+        trie = SuffixTrie()
+        # suffixes of (0, 1, 2), built from the back
+        node_2 = trie.child(2)
+        node_12 = node_2.child(1)
+        node_012 = node_12.child(0)
+        node_012.unsat.add(0b101)
+
+        # same suffix reached from another sequence gives the same node
+        self.assertIs(trie.child(2).child(1), node_12)
+        self.assertIs(trie.child(2).child(1).child(0), node_012)
+        self.assertSetEqual(set(trie.child(2).child(1).child(0).unsat), {0b101})
+        self.assertIsNot(trie.child(1).child(2), node_12)
+
+
+class TestSetTrie(TestCase):
+
+    def test_queries(self):
+        random.seed(0)
+        sets = random.sample(range(1 << 8), 40)
+        trie = SetTrie()
+        for bits in sets:
+            trie.add(bits)
+        self.assertSetEqual(set(trie), set(sets))
+
+        for query in range(1 << 8):
+            subsets = {bits for bits in sets if bits & ~query == 0}
+            supersets = {bits for bits in sets if query & ~bits == 0}
+            self.assertSetEqual(set(trie.subsets(query)), subsets)
+            self.assertSetEqual(set(trie.supersets(query)), supersets)
+            self.assertEqual(trie.has_subset(query), len(subsets) > 0)
+            self.assertEqual(trie.has_superset(query), len(supersets) > 0)
+
+        for bits in sets[:20]:
+            trie.remove(bits)
+        self.assertSetEqual(set(trie), set(sets[20:]))
+
+    def test_minimal_maximal(self):
+        trie = SetTrie()
+        self.assertTrue(trie.add_minimal(0b0111))
+        self.assertTrue(trie.add_minimal(0b1011))
+        self.assertFalse(trie.add_minimal(0b1111)) # superset of a stored set
+        self.assertTrue(trie.add_minimal(0b0011)) # removes both stored supersets
+        self.assertSetEqual(set(trie), {0b0011})
+
+        trie = SetTrie()
+        self.assertTrue(trie.add_maximal(0b0011))
+        self.assertTrue(trie.add_maximal(0b0101))
+        self.assertFalse(trie.add_maximal(0b0001))
+        self.assertTrue(trie.add_maximal(0b0111))
+        self.assertSetEqual(set(trie), {0b0111})
@@ -0,0 +1,44 @@
+import os
+import json
+import tempfile
+from time import sleep
+from unittest import TestCase
+
+from ..experiments.run import instances, finished, run, _run_instance
+
+
+def _sleep_or_run(instance, dataset, arg, options, results):
+    # instance 0 sleeps past its deadline and is killed, instance 1 is run and then sends a second, late "done" record
+    if instance.endswith("/0"):
+        sleep(600)
+    _run_instance(instance, dataset, arg, options, results)
+    results.put(dict(instance=instance, event="done", status="late", time=None, length=None))
+
+
+class TestRunner(TestCase):
+
+    def test_instances(self):
+        self.assertListEqual([inst[0] for inst in instances("jobshop:3x3x20:2")], ["jobshop/3x3x20/0", "jobshop/3x3x20/1"])
+        self.assertEqual(len(instances("sudoku:4_4_sudokus.csv:3")), 3)
+        self.assertRaises(ValueError, instances, "nurses")
+
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "results.jsonl")
+            run(["sudoku:4_4_sudokus.csv:2"], output, n_workers=2, time_limit=5, grace=1, target=_sleep_or_run)
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+
+            done = {rec['instance']: rec['status'] for rec in records if rec['event'] == "done"}
+            self.assertEqual(len([rec for rec in records if rec['event'] == "done"]), 2)
+            self.assertDictEqual(done, {"sudoku/4_4_sudokus.csv/0": "killed", "sudoku/4_4_sudokus.csv/1": "ok"})
+            stages = [rec for rec in records if rec['event'] == "stage"]
+            self.assertListEqual([rec['stage'] for rec in stages], ["greedy", "filter", "relax"])
+            self.assertTrue(all(rec['length'] > 0 and rec['time'] >= 0 for rec in stages))
+            self.assertEqual(stages[0]['cache']['misses'], stages[0]['cache']['entries'])
+
+            # finished instances are skipped when restarted
+            self.assertSetEqual(finished(output), set(done))
+            run(["sudoku:4_4_sudokus.csv:2"], output)
+            with open(output) as f:
+                self.assertEqual(len(f.readlines()), len(records))
@@ -1,9 +1,15 @@
 import os
+import multiprocessing
 from unittest import TestCase
 
 import cpmpy as cp
+from cpmpy.transformations.get_variables import get_variables
 
-from ..algorithms.forward import construct_greedy
+from ..algorithms import iter_find_sequence
+from ..algorithms.forward import construct_greedy, iter_construct_greedy, smallest_next_step
+from ..algorithms.propagate import ExactPropagate
+from ..algorithms.datastructures import ConstraintGraph, Fixpoint, LiteralEncoding
+from ..algorithms.scheduling import SuccessPriorScheduler
 from ..algorithms.utils import UNSAT, print_sequence
 
 
@@ -29,3 +35,101 @@ class TestFoward(TestCase):
 
         self.assertEqual(len(seq),4)
 
+    def test_parallel(self):
+
+        x = cp.intvar(1, 4, shape=(4, 4), name="x")
+        constraints = [cp.AllDifferent(row) for row in x] + [cp.AllDifferent(col) for col in x.T]
+        constraints += [x[0, 0] == 1, x[1, 1] == 1, x[2, 2] == 2, x[3, 3] == 2, x[2, 3] == 3]
+
+        seq = construct_greedy(constraints, goal_literals=UNSAT, time_limit=120, seed=0)
+        par_seq = construct_greedy(constraints, goal_literals=UNSAT, time_limit=120, seed=0, n_workers=2)
+
+        # lowest-index propagating subset is picked, so both sequences should be the same
+        self.assertEqual(len(seq), len(par_seq))
+        for step, par_step in zip(seq, par_seq):
+            self.assertSetEqual(step['constraints'], par_step['constraints'])
+            self.assertSetEqual(step['output'], par_step['output'])
+
+    def test_stream(self):
+
+        x = cp.intvar(1, 4, shape=(4, 4), name="x")
+        constraints = [cp.AllDifferent(row) for row in x] + [cp.AllDifferent(col) for col in x.T]
+        constraints += [x[0, 0] == 1, x[1, 1] == 1, x[2, 2] == 2, x[3, 3] == 2, x[2, 3] == 3]
+
+        events = list(iter_find_sequence(constraints, time_limit=120))
+        stages = [event for event in events if event['event'] == "stage"]
+        self.assertListEqual([event['stage'] for event in stages], ["greedy", "filter", "relax"])
+        # every greedy step is streamed, and every step not in the filtered sequence is removed
+        greedy = [event['step'] for event in events if event['event'] == "step"]
+        removed = [event['step'] for event in events if event['event'] == "removed" and event['stage'] == "filter"]
+        self.assertListEqual(greedy, stages[0]['seq'])
+        self.assertEqual(len(greedy) - len(removed), len(stages[1]['seq']))
+        relaxed = [event['index'] for event in events if event['event'] == "relaxed"]
+        self.assertListEqual(relaxed, list(reversed(range(len(stages[1]['seq'])))))
+
+        # closing the generator stops construction and the worker processes
+        steps = iter_construct_greedy(constraints, goal_literals=UNSAT, time_limit=120, seed=0, n_workers=2)
+        first = next(steps)
+        self.assertEqual(first['event'], "step")
+        steps.close()
+        self.assertEqual(len(multiprocessing.active_children()), 0)
+
+    def test_scheduler(self):
+
+        x = cp.intvar(1, 4, shape=(4, 4), name="x")
+        constraints = [cp.AllDifferent(row) for row in x] + [cp.AllDifferent(col) for col in x.T]
+        constraints += [x[0, 0] == 1, x[1, 1] == 1, x[2, 2] == 2, x[3, 3] == 2, x[2, 3] == 3]
+
+        sched_seq = construct_greedy(constraints, goal_literals=UNSAT, time_limit=120, seed=0, scheduler=SuccessPriorScheduler)
+
+        # candidates are reordered within a size, so steps may differ, but each step should be valid
+        self.assertTrue(UNSAT <= sched_seq[-1]['output'])
+        for step in sched_seq:
+            propagator = ExactPropagate(list(step['constraints']))
+            derived = propagator.propagate(step['input'], list(step['constraints']), time_limit=10)
+            self.assertTrue(step['output'] <= derived)
+
+        # candidates are ranked in a bounded window, without enumerating all of them first
+        graph = ConstraintGraph(constraints)
+        encoding = LiteralEncoding(get_variables(constraints))
+        candidates = list(graph.connected_subsets(2))
+        full, windowed = SuccessPriorScheduler(graph, encoding), SuccessPriorScheduler(graph, encoding, window=3)
+        for scheduler in (full, windowed):
+            scheduler.update([constraints[8]], encoding.encode({x[0, 0] != val for val in (2, 3, 4)}))
+        enumerated = []
+        order = windowed.order((enumerated.append(idxes) or idxes for idxes in candidates), 0)
+        first = next(iter(order))
+        self.assertEqual(len(enumerated), 4)
+        self.assertListEqual(sorted([first] + list(order)), sorted(candidates))
+        # candidates with the shrunk variable in their scope come first, the window yields the best of those it has seen
+        ranked = list(full.order(iter(candidates), 0))
+        self.assertEqual(first, min(candidates[:4], key=ranked.index))
+        self.assertTrue(all(8 in idxes or 0 in idxes or 4 in idxes for idxes in ranked[:5]))
+
+    def test_fixpoint(self):
+
+        x, y, z = [cp.boolvar(name=n) for n in "xyz"]
+
+        c1 = x + y + z <= 1
+        c2 = x + y >= 1
+        c3 = x + z >= 1
+
+        propagator = ExactPropagate([c1, c2, c3])
+        fixpoint = Fixpoint()
+        cons, new_literals = smallest_next_step([], [c1, c2, c3], propagator, time_limit=10, fixpoint=fixpoint)
+
+        # no single constraint propagates, so all of them are recorded together with their scope
+        self.assertSetEqual(set(cons), {c1, c2})
+        self.assertSetEqual(set(new_literals), {z != 1})
+        self.assertEqual(len(fixpoint), 3)
+        self.assertEqual(fixpoint[(c1,)], frozenset({x, y, z}))
+
+        # subsets in the fixpoint are skipped
+        fixpoint[(c1, c2)] = frozenset({x, y, z})
+        cons, new_literals = smallest_next_step([], [c1, c2, c3], propagator, time_limit=10, fixpoint=fixpoint)
+        self.assertSetEqual(set(cons), {c1, c3})
+
+        # reducing the domain of z invalidates all subsets with z in their scope
+        fixpoint.invalidate([z])
+        self.assertNotIn((c1,), fixpoint)
+        self.assertIn((c2,), fixpoint)
@@ -3,6 +3,7 @@
 from unittest import TestCase
 
 from ..algorithms.propagate import CPPropagate, MaximalPropagate, ExactPropagate, MaximalPropagateSolveAll
+from ..algorithms.utils import UNSAT
 import cpmpy as cp
 
 class PropagateTests(TestCase):
@@ -85,6 +86,57 @@ class PropagateTests(TestCase):
 
         self.assertSetEqual(new_literals, literals_should)
 
+    def test_propagate_many(self):
+
+        x = cp.intvar(1,4,shape=4, name="x")
+
+        constraints = [cp.AllDifferent(x), x[0] + x[1] <= 3, x[2] >= x[3] + 2, x[1] != 2]
+        subsets = [[constraints[0]], [constraints[1]], constraints[:2], [constraints[2], constraints[3]], [constraints[1], constraints[3]]]
+        propagator = self.PROP(constraints)
+
+        literals = frozenset({x[0] != 2, x[3] != 1})
+        new_literals = propagator.propagate_many(literals, subsets, time_limit=10)
+        self.assertEqual(len(new_literals), len(subsets))
+
+        # same results as propagating each subset on its own
+        propagator = self.PROP(constraints, caching=False)
+        for subset, lits in zip(subsets, new_literals):
+            self.assertSetEqual(lits, propagator.propagate(literals, subset, time_limit=10))
+
+    def test_changing_literals(self):
+
+        x = cp.intvar(1,4,shape=4, name="x")
+
+        constraints = [cp.AllDifferent(x), x[0] + x[1] <= 4]
+        propagator = self.PROP(constraints, caching=False)
+
+        # literals grow, shrink and move to other variables between calls
+        sequence = [frozenset(),
+                    frozenset({x[0] != 1}),
+                    frozenset({x[0] != 1, x[0] != 2, x[2] != 4}),
+                    frozenset({x[2] != 4}),
+                    frozenset({x[1] != 1, x[1] != 2, x[1] != 3}),
+                    frozenset()]
+        for literals in sequence:
+            for subset in [constraints, constraints[:1]]:
+                fresh = self.PROP(constraints, caching=False)
+                self.assertSetEqual(propagator.propagate(literals, subset, time_limit=10),
+                                    fresh.propagate(literals, subset, time_limit=10))
+
+    def test_cumulative(self):
+
+        s, e = cp.intvar(0, 4, shape=3, name="s"), cp.intvar(0, 6, shape=3, name="e")
+        t, f = cp.intvar(0, 3, shape=2, name="t"), cp.intvar(0, 3, shape=2, name="f")
+        c1 = cp.Cumulative(s, [2, 2, 2], e, 1, 1)
+        c2 = cp.Cumulative(t, [1, 1], f, 1, 1)
+        propagator = self.PROP([c1, c2], caching=False)
+
+        # scheduling constraints refer to their intervals, also when switched on after other constraints
+        self.assertSetEqual(propagator.propagate(frozenset(), [c1, c2], time_limit=10),
+                            propagator.propagate(frozenset(), [c2, c1], time_limit=10))
+        overlap = frozenset({t[0] != 1, t[0] != 2, t[0] != 3, t[1] != 1, t[1] != 2, t[1] != 3})
+        self.assertTrue(UNSAT <= propagator.propagate(overlap, [c1, c2], time_limit=10))
+
 class TestCPPropagate(PropagateTests):
 
     def setUp(self):
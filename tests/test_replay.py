@@ -0,0 +1,89 @@
+import os
+import tempfile
+from functools import partial
+from unittest import TestCase
+from unittest.mock import patch
+
+import cpmpy as cp
+
+from ..algorithms.forward import construct_greedy
+from ..algorithms.backward import filter_sequence, relax_sequence
+from ..algorithms.propagate import MaximalPropagate, CPPropagate
+from ..algorithms.replay import PropagationTrace, RecordingPropagator, ReplayPropagator
+from ..algorithms.utils import UNSAT
+
+
+def make_model():
+    x = cp.intvar(1, 3, shape=4, name="x")
+    return [cp.AllDifferent(x[:3]), cp.AllDifferent(x[1:]), x[0] < x[1], x[1] < x[2], x[3] > x[2]]
+
+
+class TestReplay(TestCase):
+
+    def test_propagate(self):
+        constraints = make_model()
+        trace = PropagationTrace()
+        recorder = RecordingPropagator(constraints, trace=trace, propagator_class=MaximalPropagate)
+        x = {var.name: var for var in recorder.encoding.vars}
+        calls = [(set(), constraints[:1]), ({x["x[0]"] != 1}, constraints[2:4]), ({x["x[2]"] != 3}, constraints[3:]), (set(), [])]
+        results = [recorder.propagate(lits, cons) for lits, cons in calls]
+        recorder.propagate(*calls[1]) # from cache, recorded once
+        self.assertEqual(len(trace), 4)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json.gz")
+            trace.save(path)
+            # replay on a freshly built model, with a different order of variables in the encoding
+            constraints = make_model()[::-1]
+            replay = ReplayPropagator(constraints, trace=path)
+        cons_by_str = {str(cons): cons for cons in constraints}
+        vars_by_name = {var.name: var for var in replay.encoding.vars}
+        for (lits, cons), result in zip(calls, results):
+            lits = {vars_by_name[lit.args[0].name] != lit.args[1] for lit in lits}
+            replayed = replay.propagate(lits, [cons_by_str[str(c)] for c in cons])
+            self.assertSetEqual({str(lit) for lit in replayed}, {str(lit) for lit in result})
+
+        self.assertRaises(KeyError, replay.propagate, set(), constraints[:2])
+
+    def test_full_domain(self):
+        # nothing is propagated, so the variables in the scope of the call have no literal in the trace
+        x, y = cp.intvar(0, 5, name="x"), cp.intvar(0, 5, name="y")
+        constraints = [x >= y]
+        trace = PropagationTrace()
+        recorder = RecordingPropagator(constraints, trace=trace)
+        calls = [set(), {y != 0}] # the second call prunes x, but y keeps all values but one
+        results = [recorder.propagate(lits, constraints) for lits in calls]
+        self.assertSetEqual(results[0], frozenset())
+
+        replay = ReplayPropagator(constraints, trace=trace)
+        for lits, result in zip(calls, results):
+            self.assertSetEqual(replay.propagate(lits, constraints), result)
+
+    def test_pipeline(self):
+        trace = PropagationTrace()
+        seq = construct_greedy(make_model(), UNSAT, 60, 0, PROP=partial(RecordingPropagator, trace=trace))
+        filtered = filter_sequence(seq, UNSAT, 60, propagator_class=partial(RecordingPropagator, trace=trace))
+
+        # the replayed sequences are the same as the recorded ones
+        replay_seq = construct_greedy(make_model(), UNSAT, 60, 0, PROP=partial(ReplayPropagator, trace=trace))
+        replay_filtered = filter_sequence(replay_seq, UNSAT, 60, propagator_class=partial(ReplayPropagator, trace=trace))
+        as_str = lambda seq: [(sorted(map(str, step['constraints'])), sorted(map(str, step['input'])), sorted(map(str, step['output'])))
+                              for step in seq]
+        self.assertListEqual(as_str(replay_seq), as_str(seq))
+        self.assertListEqual(as_str(replay_filtered), as_str(filtered))
+
+    def test_no_solver(self):
+        trace = PropagationTrace()
+        seq = construct_greedy(make_model(), UNSAT, 60, 0, PROP=partial(RecordingPropagator, trace=trace))
+        filter_sequence(seq, UNSAT, 60, propagator_class=partial(RecordingPropagator, trace=trace))
+
+        # greedy construction and filtering replay without creating any solver, relaxing does not
+        with patch.object(cp.SolverLookup, "get", side_effect=AssertionError("no solver should be created")):
+            replay_seq = construct_greedy(make_model(), UNSAT, 60, 0, PROP=partial(ReplayPropagator, trace=trace))
+            replay_filtered = filter_sequence(replay_seq, UNSAT, 60, propagator_class=partial(ReplayPropagator, trace=trace))
+            self.assertRaises(AssertionError, relax_sequence, replay_filtered, time_limit=60)
+            # the solver-based checks of filtering only run when asked for
+            self.assertRaises(AssertionError, filter_sequence, replay_seq, UNSAT, 60,
+                              propagator_class=partial(ReplayPropagator, trace=trace), checker_solver="exact")
+            self.assertRaises(AssertionError, filter_sequence, replay_seq, UNSAT, 60,
+                              propagator_class=partial(ReplayPropagator, trace=trace), cp_propagator_class=CPPropagate)
@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+import cpmpy as cp
+
+from ..algorithms import find_sequence
+from ..algorithms.propagate import ExactPropagate, MaximalPropagate
+from ..algorithms.stats import Stats, timed
+
+
+class TestStats(TestCase):
+
+    def test_stats(self):
+        updates = []
+        stats = Stats(callback=lambda kind, name, value: updates.append((kind, name)), trace=True)
+        stats.count("a")
+        stats.count("a", 2)
+        stats.observe("size", 2)
+        stats.observe("size", 2)
+        with timed(stats, "outer"):
+            with stats.timer("outer.inner"):
+                pass
+        with timed(None, "ignored"):
+            pass
+
+        summary = stats.summary()
+        self.assertDictEqual(summary['counters'], {"a": 3})
+        self.assertDictEqual(summary['histograms'], {"size": {2: 2}})
+        self.assertGreaterEqual(summary['timers']['outer'], summary['timers']['outer.inner'])
+        self.assertListEqual(updates, [("count", "a"), ("count", "a"), ("observe", "size"), ("observe", "size"),
+                                       ("time", "outer.inner"), ("time", "outer")])
+
+        events = stats.chrome_trace()['traceEvents']
+        self.assertListEqual([event['name'] for event in events], ["outer.inner", "outer", "counters"])
+        inner, outer = events[0], events[1]
+        self.assertTrue(outer['ts'] <= inner['ts'] and inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur'])
+        self.assertRaises(AssertionError, Stats().chrome_trace)
+
+    def test_propagator(self):
+        x = cp.intvar(1, 3, shape=3, name="x")
+        constraints = [cp.AllDifferent(x), x[0] < x[1]]
+
+        for propagator_class in (ExactPropagate, MaximalPropagate):
+            stats = Stats()
+            propagator = propagator_class(constraints, stats=stats)
+            propagator.propagate({x[0] != 1}, constraints)
+            propagator.propagate({x[0] != 1}, constraints) # from cache
+            propagator.propagate(set(), [constraints[1]])
+
+            summary = stats.summary()
+            self.assertDictEqual(summary['counters'], {"propagate.calls": 3, "propagate.cache_hits": 1, "propagate.cache_misses": 2})
+            self.assertDictEqual(summary['histograms']['propagate.subset_size'], {1: 1, 2: 2})
+            self.assertGreater(summary['timers']['propagate.solver'], 0)
+            self.assertGreaterEqual(summary['timers']['propagate.overhead'], 0)
+
+    def test_pipeline(self):
+        x, y, z = [cp.boolvar(name=n) for n in "xyz"]
+        constraints = [x + y + z <= 1, x + y >= 1, x + z >= 1, y + z >= 1]
+
+        stats = Stats()
+        seq = find_sequence(constraints, stats=stats)
+        summary = stats.summary()
+        self.assertEqual(summary['counters']['greedy.steps'], 4)
+        self.assertGreaterEqual(summary['counters']['filter.deletion_attempts'], 4)
+        self.assertEqual(summary['counters'].get('filter.deletions', 0), 4 - len(seq))
+        self.assertEqual(summary['counters']['relax.mus_calls'], 2 * len(seq) - 1)
+        self.assertTrue(all(summary['timers'][stage] > 0 for stage in ("greedy", "filter", "relax")))
@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+import cpmpy as cp
+
+from ..algorithms.subset import OCUSEngine, ocus_oneof, smus
+
+
+class TestSubset(TestCase):
+
+    def setUp(self):
+        self.x = cp.intvar(0, 3, shape=3, name="x")
+        x = self.x
+        self.soft = [x[0] >= 2, x[1] >= 2, x[2] >= 2, x[0] <= 1, x[1] <= 1]
+        self.hard = [cp.sum(x) <= 5]
+
+    def test_smus(self):
+        # the smallest conflicts are two bounds on the same variable
+        self.assertEqual(len(smus(self.soft, self.hard)), 2)
+        # the bounds of x[0] are cheaper than those of x[1]
+        subset = smus(self.soft, self.hard, weights=[5, 6, 5, 1, 1])
+        self.assertSetEqual(set(map(str, subset)), {str(self.soft[0]), str(self.soft[3])})
+
+    def test_oneof(self):
+        subset = ocus_oneof(self.soft, self.hard, oneof_idxes=[1, 2])
+        self.assertEqual(len([cons for cons in subset if str(cons) in {str(self.soft[1]), str(self.soft[2])}]), 1)
+
+    def test_engine(self):
+        x = self.x
+        for grow in ("maxsat", "greedy"):
+            engine = OCUSEngine(self.hard, grow=grow)
+            self.assertEqual(len(engine.ocus(self.soft[:3])), 3)
+            n_solutions = len(engine.solutions)
+            self.assertGreater(n_solutions, 0)
+
+            # soft constraints are shared with the earlier call, hard constraints of a call are part of the universe
+            subset = engine.ocus(self.soft[:3] + [x[2] <= 0], hard=[x[0] + x[1] >= 5])
+            self.assertSetEqual(set(map(str, subset)), {str(x[2] >= 2)})
+            self.assertEqual(len(engine.soft), 5)
+
+    def test_stored_solutions(self):
+        x = self.x
+        engine = OCUSEngine(self.hard, max_solutions=1)
+        engine.ocus(self.soft[:3])
+        engine.ocus(self.soft[:3] + [x[2] <= 0], hard=[x[0] + x[1] >= 5])
+        self.assertEqual(len(engine.solutions), 1)
+
+        # checking a stored assignment does not change the values of the variables seen by the caller,
+        # stored assignments satisfy sum(x) <= 5 so they differ from these values
+        cp.SolverLookup.get("ortools", cp.Model(x == [3, 3, 3])).solve()
+        for i in range(len(engine.soft)):
+            engine._satisfied(engine.solutions[0], i)
+        self.assertListEqual(list(x.value()), [3, 3, 3])